@@ -0,0 +1,155 @@
+#!/usr/bin/python
+"""
+Checks that compacted Gerbers, made with --compact-gerbers, draw the
+same as normal ones by reading both with a parser that keeps the modal
+state (coordinates, interpolation, aperture, polarity and regions) and
+comparing the operations they end up with, e.g.,
+
+  python benchmarks/gerber_compaction.py normal/production compact/production
+
+where both directories have the Gerbers of the same board.
+"""
+
+from __future__ import print_function
+
+import os
+import re
+import sys
+import argparse
+
+
+
+# Extended commands are between '%'s; everything else is a word
+# command that ends with '*'
+_extended = re.compile(r"%([^%]*)%")
+_operation = re.compile(r"^(?:G0([123]))?(?:X(-?\d+))?(?:Y(-?\d+))?(?:D0([123]))?$")
+_aperture_select = re.compile(r"^(?:G54)?D(\d+)$")
+
+
+
+def readGerber(filename):
+    """
+    Returns the parameters of a Gerber, i.e., its extended commands,
+    and the list of its operations with the modal state that they're
+    done with, as (operation, x, y, interpolation, aperture, polarity,
+    region) tuples. 'interpolation' is only kept for D01, and the
+    aperture isn't used for operations in a region.
+    """
+
+    with open(filename) as f:
+        data = f.read()
+
+    params = []
+    operations = []
+
+    x = None
+    y = None
+    interpolation = None
+    aperture = None
+    polarity = 'D'
+    region = False
+
+    position = 0
+    for match in _extended.finditer(data + '%%'):
+        words = data[position:match.start()]
+        position = match.end()
+
+        for word in words.split('*'):
+            word = word.strip()
+
+            if word == '' or word.startswith('G04'):
+                continue
+            elif word == 'G36':
+                region = True
+                operations.append(('G36',))
+            elif word == 'G37':
+                region = False
+                operations.append(('G37',))
+            elif word == 'M02':
+                operations.append(('M02',))
+            elif _aperture_select.match(word):
+                aperture = int(_aperture_select.match(word).group(1))
+            else:
+                m = _operation.match(word)
+                if m is None:
+                    raise ValueError("%s: can't read '%s'" % (filename, word))
+                g, xs, ys, d = m.groups()
+                if g is not None:
+                    interpolation = g
+                if xs is not None:
+                    x = int(xs)
+                if ys is not None:
+                    y = int(ys)
+                if d is None:
+                    # Only sets the interpolation
+                    continue
+                if x is None or y is None:
+                    raise ValueError("%s: '%s' has no current point" % (filename, word))
+                operations.append(('D0' + d, x, y,
+                                   interpolation if d == '1' else None,
+                                   None if region else aperture,
+                                   polarity,
+                                   region))
+
+        param = match.group(1).replace('\n', '')
+        if param.startswith('LP'):
+            polarity = param[2]
+        elif param != '':
+            params.append(param)
+
+    return params, operations
+
+
+
+def compare(normal_dir, compact_dir):
+    """
+    Compares the Gerbers of both directories, and returns the number
+    of them that differ
+    """
+
+    differ = 0
+
+    for filename in sorted(os.listdir(normal_dir)):
+        if not filename.endswith('.ger'):
+            continue
+
+        normal = os.path.join(normal_dir, filename)
+        compact = os.path.join(compact_dir, filename)
+
+        normal_params, normal_ops = readGerber(normal)
+        compact_params, compact_ops = readGerber(compact)
+
+        same = (normal_params == compact_params and normal_ops == compact_ops)
+        if same == False:
+            differ += 1
+
+        print("%s: %d operations, %d -> %d bytes (%.0f%%)%s" %
+              (filename,
+               len(normal_ops),
+               os.path.getsize(normal),
+               os.path.getsize(compact),
+               100.0 * os.path.getsize(compact) / max(os.path.getsize(normal), 1),
+               '' if same else ', DIFFERENT'))
+
+    return differ
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('normal',
+                        help="directory of Gerbers made without --compact-gerbers")
+    parser.add_argument('compact',
+                        help="directory of Gerbers made with --compact-gerbers")
+    args = parser.parse_args()
+
+    differ = compare(args.normal, args.compact)
+    if differ > 0:
+        print("%d Gerbers don't draw the same" % differ)
+        return 1
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
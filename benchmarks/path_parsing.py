@@ -0,0 +1,120 @@
+#!/usr/bin/python
+"""
+Compares SVG path parsing with the pyparsing grammar to the regex
+based tokeniser, using the glyphs of PCBmodE's fonts and, optionally,
+the routing paths of boards' routing files, e.g.,
+
+  python benchmarks/path_parsing.py boards/hello-solder/hello-solder_routing.json
+
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import json
+import time
+import argparse
+from lxml import etree as et
+
+from pcbmode.utils import svg
+
+
+
+def pyparsingToList(parsed):
+    """
+    Converts the pyparsing result into the list structure that
+    svg.parsePath() returns so that the two can be compared
+    """
+    nl = []
+    for cmd in parsed:
+        lst = [cmd[0]]
+        for coord in cmd[1:]:
+            lst.append(list(coord))
+        nl.append(lst)
+    return nl
+
+
+
+def getFontPaths():
+    """
+    Returns all glyph paths from the fonts that come with PCBmodE
+    """
+    fonts_dir = os.path.join(os.path.dirname(svg.__file__), '..', 'fonts')
+    paths = []
+    for filename in sorted(os.listdir(fonts_dir)):
+        if filename.endswith('.svg'):
+            font = et.parse(os.path.join(fonts_dir, filename))
+            for glyph in font.iter('{*}glyph'):
+                d = glyph.get('d')
+                if d not in [None, '']:
+                    paths.append(d)
+    return paths
+
+
+
+def getRoutingPaths(filenames):
+    """
+    Returns all paths from routing JSON files
+    """
+    paths = []
+    for filename in filenames:
+        with open(filename) as f:
+            routing = json.load(f)
+        for pcb_layer in (routing.get('routes') or {}).values():
+            for route in pcb_layer.values():
+                if route.get('value') not in [None, '']:
+                    paths.append(route['value'])
+    return paths
+
+
+
+def bench(name, paths, repeat):
+    """
+    """
+    grammar = svg.svg_grammar()
+
+    mismatches = 0
+    for path in paths:
+        try:
+            reference = pyparsingToList(grammar.parseString(path))
+        except Exception:
+            reference = None
+        if reference != svg.parsePath(path):
+            mismatches += 1
+
+    start = time.time()
+    for i in range(repeat):
+        for path in paths:
+            pyparsingToList(svg.svg_grammar().parseString(path))
+    pyparsing_time = time.time() - start
+
+    start = time.time()
+    for i in range(repeat):
+        for path in paths:
+            svg.parsePath(path)
+    tokeniser_time = time.time() - start
+
+    print("%s: %d paths, %d mismatches" % (name, len(paths), mismatches))
+    print("  pyparsing: %.3fs" % pyparsing_time)
+    print("  tokeniser: %.3fs (x%.1f)" % (tokeniser_time, pyparsing_time / max(tokeniser_time, 1e-9)))
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('routing', nargs='*',
+                        help="routing JSON files to take paths from")
+    parser.add_argument('-r', '--repeat', type=int, default=3,
+                        help="times to parse each path")
+    args = parser.parse_args()
+
+    bench('fonts', getFontPaths(), args.repeat)
+    if len(args.routing) > 0:
+        bench('routing', getRoutingPaths(args.routing), args.repeat)
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,115 @@
+#!/usr/bin/python
+"""
+Checks that transforming a path that was already transformed gives the
+same path as transforming it once, as happens when a shape is copied
+or derived from one that was placed, using the glyphs of PCBmodE's
+fonts and a few simple paths, e.g.,
+
+  python benchmarks/path_transforms.py
+
+"""
+
+from __future__ import print_function
+
+import os
+import sys
+import argparse
+from lxml import etree as et
+
+import pcbmode.config as config
+from pcbmode.utils import svg
+from pcbmode.utils import affine
+from pcbmode.utils import svgpath
+from pcbmode.utils.svgpath import SvgPath
+
+
+
+_paths = ["M 0,0 h 4 v 1 h -4 z",
+          "M 1,1 c 2,0 3,1 3,3 s -1,3 -3,3 z",
+          "M -2,5 q 1,-4 5,-2 t 3,1"]
+
+_transforms = [affine.identity(),
+               affine.rotate(90),
+               affine.rotate(30),
+               affine.scale(2),
+               affine.compose(affine.scale(0.5), affine.rotate(-45))]
+
+
+
+def getFontPaths():
+    """
+    Returns all glyph paths from the fonts that come with PCBmodE
+    """
+    fonts_dir = os.path.join(os.path.dirname(svg.__file__), '..', 'fonts')
+    paths = []
+    for filename in sorted(os.listdir(fonts_dir)):
+        if filename.endswith('.svg'):
+            font = et.parse(os.path.join(fonts_dir, filename))
+            for glyph in font.iter('{*}glyph'):
+                d = glyph.get('d')
+                if d not in [None, '']:
+                    paths.append(d)
+    return paths
+
+
+
+def check(paths):
+    """
+    Transforms each path by each pair of transforms, one after the
+    other, and returns the number of paths whose second transform isn't
+    the same as transforming a new path
+    """
+
+    differ = 0
+
+    for path in paths:
+        for first in _transforms:
+            for second in _transforms:
+                # Transformed paths are shared in memory, so neither
+                # result can come from the other
+                svgpath._transformed_paths.clear()
+                reference = SvgPath(path)
+                reference.transformByMatrix(second)
+
+                svgpath._transformed_paths.clear()
+                transformed = SvgPath(path)
+                transformed.transformByMatrix(first)
+                transformed.transformByMatrix(second)
+
+                if (transformed.getTransformed() != reference.getTransformed() or
+                    transformed.getWidth() != reference.getWidth() or
+                    transformed.getHeight() != reference.getHeight()):
+                    differ += 1
+                    print("%s: %s then %s gives %s, not %s" %
+                          (path[:40], first, second,
+                           transformed.getTransformed()[:40],
+                           reference.getTransformed()[:40]))
+
+    return differ
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-f', '--fonts', action='store_true',
+                        help="also check the glyphs of the fonts")
+    args = parser.parse_args()
+
+    # Set as pcbmode.py does; the paths database is a plain dict
+    config.cfg['digest-digits'] = 10
+
+    paths = list(_paths)
+    if args.fonts:
+        paths += getFontPaths()
+
+    differ = check(paths)
+    print("%d paths, %d transforms: %d differ" %
+          (len(paths), len(_transforms)**2, differ))
+    if differ > 0:
+        return 1
+
+
+
+if __name__ == "__main__":
+    sys.exit(main())
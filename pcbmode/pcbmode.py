@@ -17,10 +17,12 @@ from .utils import utils
 from .utils import gerber
 from .utils import extract
 from .utils import excellon
+from .utils import production
 from .utils import messages as msg
 from .utils import bom
 from .utils import coord_file
 from .utils.board import Board
+from .utils.pathcache import openPathCache
 
 
 def cmdArgSetup(pcbmode_version):
@@ -85,6 +87,30 @@ def cmdArgSetup(pcbmode_version):
                       action='store_true', dest='no_flashes', default=False,
                       help='Do not add pad flashes to Gerbers')
 
+    argp.add_argument('--compact-gerbers',
+                      action='store_true', dest='compact_gerbers', default=False,
+                      help="Leave out of Gerbers the 'G01' codes, coordinates and aperture selections that don't change")
+
+    argp.add_argument('--reorder-gerbers',
+                      action='store_true', dest='reorder_gerbers', default=False,
+                      help="Reorder what's drawn in Gerbers, without changing the image, so that the polarity and aperture change less often; aperture selections are only saved with --compact-gerbers")
+
+    argp.add_argument('--flash-pads',
+                      action='store_true', dest='flash_pads', default=False,
+                      help="Flash pads, and their soldermask and solderpaste, that are rectangles or circles with an aperture of their shape in Gerbers instead of filling their outline")
+
+    argp.add_argument('--use-instances',
+                      action='store_true', dest='use_instances', default=False,
+                      help="Place the shapes of components with the same footprint, rotation and layer once in the SVG's 'defs' and refer to them with 'use' elements")
+
+    argp.add_argument('--stream-svg',
+                      action='store_true', dest='stream_svg', default=False,
+                      help="Write the board's SVG a layer at a time, which uses less memory for large boards")
+
+    argp.add_argument('-j', '--jobs', type=int, default=1,
+                      dest='jobs',
+                      help="Number of processes to make the board's components and production files with (default=1)")
+
     argp.add_argument('--no-docs',
                       action='store_true', dest='no_docs', default=False,
                       help='Do not add documentation')
@@ -101,6 +127,10 @@ def cmdArgSetup(pcbmode_version):
                       dest='make_bom', default=False, 
                       help='Create a bill of materials')
 
+    argp.add_argument('--export-paths-db',
+                      action='store_true', dest='export_paths_db', default=False,
+                      help="Also write the paths used by this run to 'paths_db.json' in the build directory")
+
     argp.add_argument('--sig-dig', nargs=1,
                       dest='sig_dig', default=False,
                       help="Number of significant digits to use when generating the board's SVG. Valid values are between 2 and 8.")
@@ -223,15 +253,12 @@ def makeConfig(name, version, cmdline_args):
     #---------------------------------------------------------------
     # Path database
     #---------------------------------------------------------------
-    filename = os.path.join(config.cfg['locations']['boards'], 
-                            config.cfg['name'],
-                            config.cfg['locations']['build'],
-                            'paths_db.json')
-
-    # Open database file. If it doesn't exist, leave the database in
-    # ots initial state of {}
-    if os.path.isfile(filename):
-        config.pth = utils.dictFromJsonFile(filename)
+    # Paths are looked up in the database as they're needed; see
+    # 'path-cache' in the configuration file for the settings
+    build_dir = os.path.join(config.cfg['locations']['boards'], 
+                             config.cfg['name'],
+                             config.cfg['locations']['build'])
+    config.pth = openPathCache(build_dir, config.cfg.get('path-cache'))
 
 
     #----------------------------------------------------------------
@@ -257,6 +284,7 @@ def makeConfig(name, version, cmdline_args):
         "svg"      : "http://www.w3.org/2000/svg",
         "sodipodi" : "http://sodipodi.sourceforge.net/DTD/sodipodi-0.dtd",
         "inkscape" : "http://www.inkscape.org/namespaces/inkscape",
+        "xlink"    : "http://www.w3.org/1999/xlink",
         # Namespace URI are strings; they don't need to be URLs. See:
         #  http://en.wikipedia.org/wiki/XML_namespace
         "pcbmode"  : "pcbmode"
@@ -326,6 +354,13 @@ def makeConfig(name, version, cmdline_args):
     config.tmp['no-drill-index'] = (cmdline_args.no_drill_index or
                                     config.brd['config'].get('no-drill-index') or
                                     False)
+    config.tmp['stream-svg'] = (cmdline_args.stream_svg or
+                                config.brd['config'].get('stream-svg') or
+                                False)
+    config.tmp['jobs'] = max(1, cmdline_args.jobs)
+    config.tmp['use-instances'] = (cmdline_args.use_instances or
+                                   config.brd['config'].get('use-instances') or
+                                   False)
 
 
     # Define Gerber setting from board's config or defaults
@@ -338,6 +373,34 @@ def makeConfig(name, version, cmdline_args):
     gd['digits'] = config.brd['gerber'].get('digits') or 6
     gd['steps-per-segment'] = config.brd['gerber'].get('steps-per-segment') or 100
     gd['min-segment-length'] = config.brd['gerber'].get('min-segment-length') or 0.05
+    # When set, curves are flattened to be within this distance (mm)
+    # instead of by steps and segment length
+    tolerance = config.brd['gerber'].get('flatten-tolerance')
+    if tolerance is not None:
+        if isinstance(tolerance, (int, float)):
+            value, unit = float(tolerance), None
+        else:
+            try:
+                value, unit = utils.parseDimension(tolerance)
+            except:
+                value, unit = None, None
+        if value is None or value <= 0 or unit not in [None, 'mm']:
+            msg.error("The Gerber 'flatten-tolerance' setting should be a positive number, in mm, but it's '%s'. For example, 0.01 or '0.01mm' should work." % tolerance)
+        tolerance = value
+    gd['flatten-tolerance'] = tolerance
+    # Leave out commands and coordinates that are the same as the
+    # current ones
+    gd['compact'] = (cmdline_args.compact_gerbers or
+                     config.brd['gerber'].get('compact') or
+                     False)
+    # Draw paths in an order with fewer polarity and aperture changes
+    gd['reorder'] = (cmdline_args.reorder_gerbers or
+                     config.brd['gerber'].get('reorder') or
+                     False)
+    # Flash rectangular and circular pads with apertures of their shape
+    gd['flash-pads'] = (cmdline_args.flash_pads or
+                        config.brd['gerber'].get('flash-pads') or
+                        False)
 
     # Inkscape inverts the 'y' axis for some historical reasons.
     # This means that we need to invert it as well. This should
@@ -428,10 +491,15 @@ def main():
         coord_file.makeCoordFile(cmdline_args.coord_file)
 
     else:
+        # The board's SVG, when it's made in this run, is used for
+        # making the production files rather than reading it back
+        svg_tree = None
+
         # Make the board
         if cmdline_args.make is True:
             msg.info("Creating board")
             board = Board()
+            svg_tree = board.getSvg()
 
         # Create production files (Gerbers, Excellon, etc.)
         if cmdline_args.fab is not False:
@@ -440,29 +508,34 @@ def main():
             else:
                 manufacturer = cmdline_args.fab.lower()
      
-            msg.info("Creating Gerbers")
-            gerber.gerberise(manufacturer)
+            # Production files can be made in parallel with the
+            # '--jobs' option
+            if config.tmp['jobs'] > 1:
+                msg.info("Creating Gerbers and excellon drill file")
+                production.makeProductionFiles(manufacturer, svg_tree,
+                                               config.tmp['jobs'])
+            else:
+                msg.info("Creating Gerbers")
+                gerber.gerberise(manufacturer, svg_tree)
 
-            msg.info("Creating excellon drill file")
-            excellon.makeExcellon(manufacturer)
+                msg.info("Creating excellon drill file")
+                excellon.makeExcellon(manufacturer, svg_tree)
      
         if cmdline_args.pngs is True:
             msg.info("Creating PNGs")
             utils.makePngs()
    
     
-    filename = os.path.join(config.cfg['locations']['boards'], 
-                            config.cfg['name'],
-                            config.cfg['locations']['build'],
-                            'paths_db.json')
+    stats = utils.text_memo_stats
+    if stats['hits'] + stats['misses'] > 0:
+        msg.info("Text: %d from cache, %d laid out" % (stats['hits'], stats['misses']))
 
-    try:
-        f = open(filename, 'w')
-    except IOError as e:
-        print("I/O error({0}): {1}".format(e.errno, e.strerror))
- 
-    json.dump(config.pth, f, sort_keys=True, indent=2)
-    f.close()
+    config.pth.save()
+
+    if cmdline_args.export_paths_db is True:
+        config.pth.exportJson(os.path.join(build_dir, 'paths_db.json'))
+
+    config.pth.close()
 
     msg.info("Done!")
 
@@ -0,0 +1,179 @@
+#!/usr/bin/python
+
+import re
+from math import pi, sin, cos, tan
+
+from . import messages as msg
+
+DEG2RAD = 2 * pi / 360
+
+# 2x3 affine transform matrices are stored as six-tuples in the same
+# order as an SVG 'matrix(a,b,c,d,e,f)' transform, i.e.,
+#
+#   x' = a*x + c*y + e
+#   y' = b*x + d*y + f
+#
+
+# An SVG transform attribute is a list of these
+_svg_transform = re.compile(r"(matrix|translate|scale|rotate|skewX|skewY)\s*\(([^)]*)\)")
+_svg_number = re.compile(r"[-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[eE][-+]?\d+)?")
+
+# Matrix terms closer than this to what they're compared with are
+# taken to be equal
+_epsilon = 1e-9
+
+
+
+def identity():
+    return (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+
+def translate(x, y):
+    return (1.0, 0.0, 0.0, 1.0, float(x), float(y))
+
+
+
+def scale(sx, sy=None):
+    if sy is None:
+        sy = sx
+    return (float(sx), 0.0, 0.0, float(sy), 0.0, 0.0)
+
+
+
+def rotate(deg):
+    """
+    Rotation by 'deg' degrees in the same direction as Point.rotate()
+    """
+    rad = deg * DEG2RAD
+    return (cos(rad), -sin(rad), sin(rad), cos(rad), 0.0, 0.0)
+
+
+
+def mirror():
+    """
+    Mirrors horizontally, i.e., negates 'x'
+    """
+    return (-1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+
+def multiply(m1, m2):
+    """
+    Returns the matrix that applies 'm2' and then 'm1'
+    """
+    a1, b1, c1, d1, e1, f1 = m1
+    a2, b2, c2, d2, e2, f2 = m2
+    return (a1*a2 + c1*b2,
+            b1*a2 + d1*b2,
+            a1*c2 + c1*d2,
+            b1*c2 + d1*d2,
+            a1*e2 + c1*f2 + e1,
+            b1*e2 + d1*f2 + f1)
+
+
+
+def compose(*matrices):
+    """
+    Returns the matrix that applies the matrices from last to first,
+    like a list of SVG transforms
+    """
+    result = identity()
+    for matrix in matrices:
+        result = multiply(result, matrix)
+    return result
+
+
+
+def applyToPoint(m, x, y):
+    a, b, c, d, e, f = m
+    return a*x + c*y + e, b*x + d*y + f
+
+
+
+def applyToVector(m, x, y):
+    """
+    Applies the matrix without its translation, as for the relative
+    coordinates of a path
+    """
+    a, b, c, d, e, f = m
+    return a*x + c*y, b*x + d*y
+
+
+
+def applyToValues(m, values):
+    """
+    Applies the matrix without its translation to a flat list of 'x'
+    and 'y' values, as applyToVector() does
+    """
+    a, b, c, d, e, f = m
+    result = []
+    for n in range(0, len(values), 2):
+        x = values[n]
+        y = values[n+1]
+        result.append(a*x + c*y)
+        result.append(b*x + d*y)
+    return result
+
+
+
+def isTranslation(m):
+    """
+    Returns True if the matrix only moves things
+    """
+    a, b, c, d, e, f = m
+    return (abs(a - 1) < _epsilon and abs(b) < _epsilon and
+            abs(c) < _epsilon and abs(d - 1) < _epsilon)
+
+
+
+def isRigid(m):
+    """
+    Returns True if the matrix doesn't change the size or shape of
+    things, i.e., it only rotates, mirrors and moves them
+    """
+    a, b, c, d, e, f = m
+    return (abs(a*a + b*b - 1) < _epsilon and
+            abs(c*c + d*d - 1) < _epsilon and
+            abs(a*c + b*d) < _epsilon)
+
+
+
+def fromSvgTransform(transform):
+    """
+    Returns the matrix of an SVG 'transform' attribute
+    """
+
+    matrix = identity()
+    found = False
+
+    for name, args in _svg_transform.findall(transform):
+        values = [float(v) for v in _svg_number.findall(args)]
+        found = True
+
+        if name == 'matrix' and len(values) == 6:
+            m = tuple(values)
+        elif name == 'translate' and len(values) in [1, 2]:
+            m = translate(values[0], values[1] if len(values) == 2 else 0)
+        elif name == 'scale' and len(values) in [1, 2]:
+            m = scale(*values)
+        elif name == 'rotate' and len(values) in [1, 3]:
+            # SVG rotates the other way around
+            m = rotate(-values[0])
+            if len(values) == 3:
+                m = compose(translate(values[1], values[2]),
+                            m,
+                            translate(-values[1], -values[2]))
+        elif name == 'skewX' and len(values) == 1:
+            m = (1.0, 0.0, tan(values[0] * DEG2RAD), 1.0, 0.0, 0.0)
+        elif name == 'skewY' and len(values) == 1:
+            m = (1.0, tan(values[0] * DEG2RAD), 0.0, 1.0, 0.0, 0.0)
+        else:
+            msg.error("Found an SVG transform that cannot be handled, %s" % transform)
+
+        matrix = multiply(matrix, m)
+
+    if found == False and transform.strip() != '':
+        msg.error("Found an SVG transform that cannot be handled, %s" % transform)
+
+    return matrix
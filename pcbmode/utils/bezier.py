@@ -0,0 +1,277 @@
+#!/usr/bin/python
+
+from math import sqrt, ceil
+
+try:
+    import numpy as np
+except ImportError:
+    # Curves will be flattened one at a time in pure Python
+    np = None
+
+import pcbmode.config as config
+
+# import pcbmode modules
+from .point import Point
+
+
+
+def flattenCubics(curves, steps, length, quadratic=None):
+    """
+    Linearises a batch of cubic Bezier curves, each defined as four
+    (x, y) points [start, control, control, end]. Each curve is
+    sampled at 'steps' points, and then samples are skipped so that
+    the segments are roughly 'length' long (mm). The curve's end
+    point is always added at the end.
+
+    Quadratic Bezier curves (Q/q and T/t commands) that were converted
+    to cubic ones use a slightly different rule for how many samples
+    to skip; 'quadratic' is a list of booleans marking these.
+
+    Returns a list of polylines, one for each curve, that are lists
+    of (x, y) points.
+    """
+
+    if len(curves) == 0:
+        return []
+
+    if quadratic is None:
+        quadratic = [False] * len(curves)
+
+    if np is None:
+        return [_flattenCubic(curve, steps, length, quad)
+                for curve, quad in zip(curves, quadratic)]
+
+    return _flattenCubicsNumpy(curves, steps, length, quadratic)
+
+
+
+
+def flattenCubicsToTolerance(curves, tolerance, max_depth=16):
+    """
+    Linearises a batch of cubic Bezier curves, each defined as four
+    (x, y) points [start, control, control, end], so that no point on
+    a curve is further than 'tolerance' (mm) from its polyline. Curves
+    are split in half until each piece is flat enough, so tight curves
+    get more points than gentle ones. 'max_depth' limits how many times
+    a curve can be split, i.e., to 2**max_depth pieces.
+
+    Returns a list of polylines, one for each curve, that are lists
+    of (x, y) points.
+    """
+
+    # The flatness test is done on squared distances, multiplied by 16
+    limit = 16.0 * tolerance * tolerance
+
+    polylines = []
+    for curve in curves:
+        points = [tuple(curve[0])]
+        _subdivideCubic(curve, limit, max_depth, points)
+        polylines.append(points)
+
+    return polylines
+
+
+
+
+def _subdivideCubic(p, limit, depth, points):
+    """
+    Adds the end points of the flat pieces of curve 'p' to 'points'.
+
+    The flatness test is Roger Willcocks' bound on how far a cubic
+    Bezier can be from the line between its end points.
+    """
+
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = p
+
+    ux = 3*x1 - 2*x0 - x3
+    uy = 3*y1 - 2*y0 - y3
+    vx = 3*x2 - 2*x3 - x0
+    vy = 3*y2 - 2*y3 - y0
+
+    if depth == 0 or max(ux*ux, vx*vx) + max(uy*uy, vy*vy) <= limit:
+        points.append((x3, y3))
+        return
+
+    # Split the curve in half (de Casteljau)
+    x01, y01 = (x0 + x1) / 2.0, (y0 + y1) / 2.0
+    x12, y12 = (x1 + x2) / 2.0, (y1 + y2) / 2.0
+    x23, y23 = (x2 + x3) / 2.0, (y2 + y3) / 2.0
+    x012, y012 = (x01 + x12) / 2.0, (y01 + y12) / 2.0
+    x123, y123 = (x12 + x23) / 2.0, (y12 + y23) / 2.0
+    xm, ym = (x012 + x123) / 2.0, (y012 + y123) / 2.0
+
+    _subdivideCubic(((x0, y0), (x01, y01), (x012, y012), (xm, ym)), limit, depth-1, points)
+    _subdivideCubic(((xm, ym), (x123, y123), (x23, y23), (x3, y3)), limit, depth-1, points)
+
+
+
+
+def _getSkip(curve_length, steps, length, quadratic):
+    """
+    Returns the stride at which curve samples are picked in order to
+    get segments of about 'length'
+    """
+    if curve_length == 0:
+        return steps
+    if quadratic == True:
+        return int(ceil(steps / (curve_length / length)))
+    return int(ceil(steps / ceil(curve_length / length)))
+
+
+
+
+def _flattenCubic(curve, steps, length, quadratic):
+    """
+    Linearises a single cubic Bezier curve; see flattenCubics()
+    """
+
+    points_x = _linearizeCubicBezier([p[0] for p in curve], steps)
+    points_y = _linearizeCubicBezier([p[1] for p in curve], steps)
+
+    curve_length = _getCubicBezierLength(points_x, points_y)
+    skip = _getSkip(curve_length, steps, length, quadratic)
+
+    points = [(points_x[n], points_y[n]) for n in range(0, len(points_x), skip)]
+    points.append((points_x[-1], points_y[-1]))
+
+    return points
+
+
+
+
+def _linearizeCubicBezier(p, steps):
+    """
+    This function receives four points [start, control, control, end]
+    and returns points on the cubic Bezier curve that they define. As
+    'steps' decreases, so do the amount of points that are returned,
+    making the curve less, well, curvey.
+
+    The code for this function was adapted/copied from:
+    http://www.niksula.cs.hut.fi/~hkankaan/Homepages/bezierfast.html
+    http://www.pygame.org/wiki/BezierCurve
+    """
+
+    t = 1.0 / steps
+    temp = t*t
+
+    f = p[0]
+    fd = 3 * (p[1] - p[0]) * t
+    fdd_per_2 = 3 * (p[0] - 2 * p[1] + p[2]) * temp
+    fddd_per_2 = 3 * (3 * (p[1] - p[2]) + p[3] - p[0]) * temp * t
+
+    fddd = 2 * fddd_per_2
+    fdd = 2 * fdd_per_2
+    fddd_per_6 = fddd_per_2 / 3.0
+
+    points = []
+    for x in range(steps):
+        points.append(f)
+        f += fd + fdd_per_2 + fddd_per_6
+        fd += fdd + fddd_per_2
+        fdd += fddd
+        fdd_per_2 += fddd_per_2
+    points.append(f)
+
+    return points
+
+
+
+
+def _getCubicBezierLength(px, py):
+    """
+    Return the length of a cubic bezier
+    """
+
+    length = 0.0
+
+    prev = Point(px[0], py[0])
+
+    for i in range(1, len(px)):
+        length += sqrt((px[i] - prev.x)**2 + (py[i] - prev.y)**2)
+        prev = Point(px[i], py[i])
+
+    return length
+
+
+
+
+def _flattenCubicsNumpy(curves, steps, length, quadratic):
+    """
+    Linearises all curves in one go with NumPy; see flattenCubics()
+    """
+
+    try:
+        sig_dig = config.cfg['significant-digits']
+    except:
+        sig_dig = 8
+
+    # (curves, 4, 2) control points -> (curves, steps+1, 2) samples
+    samples = _linearizeCubicBeziers(np.array(curves, dtype=float), steps)
+
+    # The length is measured from the previous sample rounded the way
+    # that Point() does, so that the result is the same as without NumPy
+    deltas = samples[:, 1:] - np.round(samples[:, :-1], sig_dig)
+    distances = np.sqrt(deltas[:, :, 0]**2 + deltas[:, :, 1]**2)
+    curve_lengths = np.cumsum(distances, axis=1)[:, -1]
+
+    ratio = curve_lengths / length
+    quadratic = np.array(quadratic, dtype=bool)
+    with np.errstate(divide='ignore'):
+        skip = np.ceil(steps / np.where(quadratic, ratio, np.ceil(ratio)))
+    # Any stride past the last sample picks only the first one, so cap
+    # it before it's made an integer
+    skip = np.where(curve_lengths == 0, steps, np.minimum(skip, steps + 1)).astype(int)
+
+    # Pick every 'skip'th sample and then the end point, which is an
+    # extra column, so that all curves are selected at once
+    picked = (np.arange(steps + 1)[np.newaxis, :] % skip[:, np.newaxis]) == 0
+    picked = np.column_stack((picked, np.ones(len(curves), dtype=bool)))
+    samples = np.concatenate((samples, samples[:, -1:]), axis=1)
+
+    points = samples[picked].tolist()
+    ends = np.cumsum(picked.sum(axis=1)).tolist()
+
+    polylines = []
+    start = 0
+    for end in ends:
+        polylines.append(points[start:end])
+        start = end
+
+    return polylines
+
+
+
+
+def _linearizeCubicBeziers(p, steps):
+    """
+    The same forward differencing as _linearizeCubicBezier() but for
+    a (curves, 4, 2) array of control points. Each of the running sums
+    becomes a cumulative sum along the steps, which adds up in the
+    same order, so the points are exactly the same.
+    """
+
+    t = 1.0 / steps
+    temp = t*t
+
+    p0, p1, p2, p3 = p[:, 0], p[:, 1], p[:, 2], p[:, 3]
+
+    f = p0
+    fd = 3 * (p1 - p0) * t
+    fdd_per_2 = 3 * (p0 - 2 * p1 + p2) * temp
+    fddd_per_2 = 3 * (3 * (p1 - p2) + p3 - p0) * temp * t
+
+    fddd = 2 * fddd_per_2
+    fdd = 2 * fdd_per_2
+    fddd_per_6 = fddd_per_2 / 3.0
+
+    def running(first, increments):
+        return np.cumsum(np.concatenate((first[:, np.newaxis], increments), axis=1), axis=1)
+
+    repeat = lambda a: np.repeat(a[:, np.newaxis], steps, axis=1)
+
+    fdd = running(fdd, repeat(fddd))
+    fdd_per_2 = running(fdd_per_2, repeat(fddd_per_2))
+    fd = running(fd, fdd[:, :-1] + repeat(fddd_per_2))
+    f = running(f, fd[:, :-1] + fdd_per_2[:, :-1] + repeat(fddd_per_6))
+
+    return f
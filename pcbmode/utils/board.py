@@ -17,5 +17,16 @@ class Board():
         module = Module(self._module_dict,
                         self._module_routing)
 
+        self._svg = module.getSvg()
+
+
+
+    def getSvg(self):
+        """
+        Returns the board's SVG as an ElementTree, or None if it isn't
+        kept after it's written
+        """
+        return self._svg
+
 
 
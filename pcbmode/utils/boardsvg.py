@@ -0,0 +1,232 @@
+#!/usr/bin/python
+
+import copy
+from lxml import etree as et
+
+import pcbmode.config as config
+from . import utils
+from . import affine
+from .point import Point
+
+
+
+# The board's SVG, which is only read once per run
+_board_svg = None
+
+
+
+
+def getBoardSvg(svg_tree=None):
+    """
+    Returns the BoardSvg of the board's SVG. If 'svg_tree', the board's
+    SVG as it was made in this run, is given it's used; otherwise the
+    SVG file is read the first time the board's SVG is asked for.
+    """
+    global _board_svg
+    if _board_svg is None or (svg_tree is not None and
+                              _board_svg.getTree() is not svg_tree):
+        _board_svg = BoardSvg(svg_tree)
+    return _board_svg
+
+
+
+
+class BoardSvg():
+    """
+    The board's SVG with an index of its PCB layer and sheet groups,
+    and of the pours' masks, which is made when it's opened so that
+    these don't need to be searched for
+    """
+
+    def __init__(self, svg_tree=None):
+
+        self._tree = utils.openBoardSVG(svg_tree)
+        self._transforms = TransformResolver()
+
+        svg_ns = config.cfg['ns']['svg']
+        pcb_layer_attrib = '{'+config.cfg['ns']['pcbmode']+'}pcb-layer'
+        sheet_attrib = '{'+config.cfg['ns']['pcbmode']+'}sheet'
+
+        # Each index has the elements in the order they're in in the
+        # document
+        self._layers = {}
+        self._masks = {}
+        # Sheets, and the PCB layer each one is in, or None
+        self._sheets = {}
+
+        for element in self._tree.iter('{%s}g' % svg_ns, '{%s}mask' % svg_ns):
+            pcb_layer = element.get(pcb_layer_attrib)
+            if element.tag == '{%s}mask' % svg_ns:
+                if pcb_layer is not None:
+                    self._masks.setdefault(pcb_layer, []).append(element)
+                continue
+
+            if pcb_layer is not None:
+                self._layers.setdefault(pcb_layer, []).append(element)
+
+            sheet = element.get(sheet_attrib)
+            if sheet is not None:
+                sheet_pcb_layer = None
+                for ancestor in element.iterancestors('{%s}g' % svg_ns):
+                    sheet_pcb_layer = ancestor.get(pcb_layer_attrib)
+                    if sheet_pcb_layer is not None:
+                        break
+                self._sheets.setdefault(sheet, []).append((sheet_pcb_layer, element))
+
+
+
+    def getTree(self):
+        return self._tree
+
+
+    def getSubdocument(self, elements):
+        """
+        Returns a serialised document with copies of 'elements', in
+        copies of the groups they're in but without any of the groups'
+        other children, so that they can be worked with on their own
+        the same way as in the whole document
+        """
+
+        root = self._tree.getroot()
+        copies = {root: et.Element(root.tag, dict(root.attrib), nsmap=root.nsmap)}
+
+        for element in elements:
+            for ancestor in reversed(list(element.iterancestors())):
+                if ancestor not in copies:
+                    copies[ancestor] = et.SubElement(copies[ancestor.getparent()],
+                                                     ancestor.tag,
+                                                     dict(ancestor.attrib))
+            copies[element.getparent()].append(copy.deepcopy(element))
+
+        return et.tostring(copies[root])
+
+
+
+    def getTransforms(self):
+        """
+        Returns the TransformResolver of the document
+        """
+        return self._transforms
+
+
+    def getLayer(self, pcb_layer):
+        """
+        Returns the group of PCB layer 'pcb_layer', or None
+        """
+        layers = self._layers.get(pcb_layer)
+        if layers is None:
+            return None
+        return layers[0]
+
+
+    def getMask(self, pcb_layer):
+        """
+        Returns the mask of the pours of PCB layer 'pcb_layer', or None
+        """
+        masks = self._masks.get(pcb_layer)
+        if masks is None:
+            return None
+        return masks[0]
+
+
+    def getSheets(self, sheet, pcb_layer=None):
+        """
+        Returns the groups of 'sheet', only those in PCB layer
+        'pcb_layer' if it's given
+        """
+        return [element for element_pcb_layer, element in self._sheets.get(sheet, [])
+                if pcb_layer is None or element_pcb_layer == pcb_layer]
+
+
+    def getSheet(self, sheet, pcb_layer=None):
+        """
+        Returns the first group of 'sheet', as getSheets(), or None
+        """
+        sheets = self.getSheets(sheet, pcb_layer)
+        if len(sheets) == 0:
+            return None
+        return sheets[0]
+
+
+
+
+class TransformResolver():
+    """
+    Works out where elements are by combining their transform with
+    those of the groups they're in. A group's combined transform is
+    worked out once, from the nearest group above it whose combined
+    transform is known, and kept for the elements in it.
+    """
+
+    def __init__(self):
+        # Combined transform of each group that has been worked out
+        self._matrices = {}
+
+
+
+    def getMatrix(self, element):
+        """
+        Returns the matrix of the transform of 'element' combined with
+        those of all its ancestors
+        """
+        return self._combine(self._getGroupMatrix(element.getparent()), element)
+
+
+
+    def getLocation(self, element):
+        """
+        Returns where the origin of 'element' is, as a Point
+        """
+        matrix = self.getMatrix(element)
+        return Point(matrix[4], matrix[5])
+
+
+
+    def _getGroupMatrix(self, group):
+
+        if group is None:
+            return affine.identity()
+
+        matrix = self._matrices.get(group)
+        if matrix is not None:
+            return matrix
+
+        # Go up to the nearest group whose transform is known...
+        groups = []
+        while group is not None and group not in self._matrices:
+            groups.append(group)
+            group = group.getparent()
+
+        if group is None:
+            matrix = affine.identity()
+        else:
+            matrix = self._matrices[group]
+
+        # ...and back down, combining transforms
+        for group in reversed(groups):
+            matrix = self._combine(matrix, group)
+            self._matrices[group] = matrix
+
+        return matrix
+
+
+
+    def _combine(self, matrix, element):
+        """
+        Returns 'matrix' combined with the transform of 'element'.
+        Translations are rounded like those of Point so that locations
+        come out the same as when they're added up as Points.
+        """
+
+        transform = element.get('transform')
+        if transform is None:
+            return matrix
+
+        sig_dig = config.cfg['significant-digits']
+
+        a, b, c, d, e, f = affine.fromSvgTransform(transform)
+        a, b, c, d, e, f = affine.multiply(matrix, (a, b, c, d,
+                                                    round(e, sig_dig),
+                                                    round(f, sig_dig)))
+
+        return (a, b, c, d, round(e, sig_dig), round(f, sig_dig))
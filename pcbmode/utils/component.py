@@ -1,6 +1,7 @@
 #!/usr/bin/python
 
 import os
+import multiprocessing
 
 import pcbmode.config as config
 import copy
@@ -14,6 +15,87 @@ from .footprint import Footprint
 
 
 
+# Footprints that have been processed, by filename, with the file's
+# modification time when it was read
+_footprints = {}
+
+
+
+
+def getFootprint(filename):
+    """
+    Returns the Footprint defined in 'filename'. Each footprint file is
+    only read and processed once, unless it changes.
+    """
+    mtime = os.path.getmtime(filename)
+    cached = _footprints.get(filename)
+    if cached is None or cached[0] != mtime:
+        cached = (mtime, Footprint(utils.dictFromJsonFile(filename)))
+        _footprints[filename] = cached
+    return cached[1]
+
+
+
+
+def makeComponents(items, jobs):
+    """
+    Makes a Component for each (refdef, component definition) in
+    'items' with a pool of 'jobs' processes. The components' paths are
+    transformed by the workers, and the paths and texts they add to
+    the paths database are merged into this process's.
+    Returns the components in the same order as 'items'.
+    """
+
+    pool = multiprocessing.Pool(jobs,
+                                utils.initWorker,
+                                utils.getWorkerConfig())
+    try:
+        chunksize = max(1, len(items) // (jobs*4))
+        results = pool.map(_makeComponent, items, chunksize)
+    finally:
+        pool.close()
+        pool.join()
+
+    components = []
+    for component, new, used, text_stats in results:
+        config.pth.merge(new, used)
+        for key in text_stats:
+            utils.text_memo_stats[key] += text_stats[key]
+        components.append(component)
+
+    return components
+
+
+
+
+def _makeComponent(item):
+    """
+    Makes a component in a worker process of makeComponents()
+    """
+
+    refdef, component_dict = item
+    component = Component(refdef, component_dict)
+
+    # Do the work of transforming the paths here rather than when
+    # the shapes are placed
+    mirrored = component.getPlacementLayer() == 'bottom'
+    shapes = component.getShapes()
+    for sheet in shapes:
+        for layer in shapes[sheet]:
+            for shape in shapes[sheet][layer]:
+                shape.getTransformedPath(mirrored)
+
+    new, used = config.pth.popChanges()
+
+    text_stats = dict(utils.text_memo_stats)
+    for key in utils.text_memo_stats:
+        utils.text_memo_stats[key] = 0
+
+    return component, new, used, text_stats
+
+
+
+
 class Component():
     """
     """
@@ -48,20 +130,19 @@ class Component():
                              config.cfg['locations']['components'],
                              filename)]
 
-        footprint_dict = None
+        footprint = None
         for path in paths:
             if os.path.isfile(path):
-                footprint_dict = utils.dictFromJsonFile(path)
+                footprint = getFootprint(path)
                 break
 
-        if footprint_dict == None:
+        if footprint == None:
             fname_list = ""
             for path in paths:
                 fname_list += " %s" % path
             msg.error("Couldn't find shape file. Looked for it here:\n%s" % (fname_list))
 
-        footprint = Footprint(footprint_dict)
-        footprint_shapes = footprint.getShapes()
+        footprint_shapes = footprint.getShapesCopy()
 
         #------------------------------------------------        
         # Apply component-specific modifiers to footprint
@@ -204,3 +285,11 @@ class Component():
 
     def getRotation(self):
         return self._rotate
+
+
+    def getScale(self):
+        return self._scale
+
+
+    def getRotatePoint(self):
+        return self._rotate_point
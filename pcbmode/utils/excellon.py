@@ -2,30 +2,42 @@
 
 import os
 import re
+import time
 from lxml import etree as et
 
 import pcbmode.config as config
 from . import messages as msg
 
 # pcbmode modules
-from . import utils
+from . import affine
 from .point import Point
+from .boardsvg import getBoardSvg, TransformResolver
 
 
 
-def makeExcellon(manufacturer='default'):
+def makeExcellon(manufacturer='default', svg_tree=None):
     """
+    'svg_tree' is the board's SVG if it was made in this run; otherwise
+    it's read from the file.
     """
 
-    ns = {'pcbmode':config.cfg['ns']['pcbmode'],
-          'svg':config.cfg['ns']['svg']} 
-
     # Open the board's SVG
-    svg_in = utils.openBoardSVG()
-    drills_layer = svg_in.find("//svg:g[@pcbmode:sheet='drills']",
-                               namespaces=ns)
+    board_svg = getBoardSvg(svg_tree)
+
+    job = getExcellonJob(manufacturer)
+    start = time.time()
+    writeExcellon(job, board_svg)
+    msg.subInfo("%s (%.2fs)" % (os.path.basename(job['filename']),
+                                 time.time() - start))
+
 
-    excellon = Excellon(drills_layer)
+
+
+def getExcellonJob(manufacturer):
+    """
+    Returns the job that writeExcellon() makes the drill file of, as
+    for gerber.getGerberJobs()
+    """
 
     # Save to file
     base_dir = os.path.join(config.cfg['base-dir'], 
@@ -38,9 +50,35 @@ def makeExcellon(manufacturer='default'):
 
     add = '_%s.%s' % ('drills',
                       filename_info['plated'].get('ext') or 'txt')
-    filename = os.path.join(base_dir, base_name + add)
 
-    with open(filename, "wb") as f:
+    return {'type': 'excellon',
+            'filename': os.path.join(base_dir, base_name + add),
+            'pcb-layer': None,
+            'sheet': 'drills'}
+
+
+
+
+def getExcellonJobElements(job, board_svg):
+    """
+    Returns the elements of the board's SVG that the drill file is
+    made of
+    """
+    return [board_svg.getSheet('drills')]
+
+
+
+
+def writeExcellon(job, board_svg):
+    """
+    Makes the drill file of the job from getExcellonJob() and writes it
+    """
+
+    drills_layer = board_svg.getSheet('drills')
+
+    excellon = Excellon(drills_layer, board_svg.getTransforms())
+
+    with open(job['filename'], "wb") as f:
         for line in excellon.getExcellon():
             f.write(line)
 
@@ -52,11 +90,15 @@ class Excellon():
     """
     """
 
-    def __init__(self, svg):
+    def __init__(self, svg, transforms=None):
         """
+        'transforms' is the TransformResolver of the document
         """
 
         self._svg = svg
+        self._transforms = transforms
+        if self._transforms is None:
+            self._transforms = TransformResolver()
 
         self._ns = {'pcbmode':config.cfg['ns']['pcbmode'],
                     'svg':config.cfg['ns']['svg']} 
@@ -138,24 +180,12 @@ class Excellon():
         its ancestors, and its own transform
         """
 
-        location = Point()
-
-        # We need to get the transforms of all ancestors that have
-        # one in order to get the location correctly
-        ancestors = path.xpath("ancestor::*[@transform]")
-        for ancestor in ancestors:
-            transform = ancestor.get('transform')
-            transform_data = utils.parseTransform(transform)
-            # Add them up
-            location += transform_data['location']
-
-        # Add the transform of the path itself
-        transform = path.get('transform')
-        if transform != None:
-            transform_data = utils.parseTransform(transform)
-            location += transform_data['location']        
+        # A drill's diameter can't be scaled or skewed
+        matrix = self._transforms.getMatrix(path)
+        if not affine.isRigid(matrix):
+            msg.error("A drill can only be rotated or mirrored by its transforms, not scaled or skewed, since its diameter would change")
 
-        return location
+        return Point(matrix[4], matrix[5])
 
 
 
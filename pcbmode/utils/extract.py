@@ -9,6 +9,7 @@ from . import messages as msg
 # pcbmode modules
 from . import utils
 from .point import Point
+from .boardsvg import getBoardSvg
 
 
 
@@ -16,22 +17,22 @@ def extract(extract, extract_refdefs):
     """
     """
 
-    svg_in = utils.openBoardSVG()
+    board_svg = getBoardSvg()
 
 
     if extract == True:
         msg.info("Extracting routing and vias")
-        extractRouting(svg_in)
+        extractRouting(board_svg)
      
         msg.info("Extracting components info")
-        extractComponents(svg_in)
+        extractComponents(board_svg)
      
         msg.info("Extracting documentation and indicies locations")
-        extractDocs(svg_in)
+        extractDocs(board_svg)
     
     if extract_refdefs == True:
         msg.info("Extracting refdefs info")
-        extractRefdefs(svg_in)
+        extractRefdefs(board_svg)
 
 
     return
@@ -39,22 +40,27 @@ def extract(extract, extract_refdefs):
 
 
 
-def extractComponents(svg_in):
+def extractComponents(board_svg):
     """
     """
     
-    xpath_expr_place = '//svg:g[@pcbmode:pcb-layer="%s"]//svg:g[@pcbmode:sheet="placement"]//svg:g[@pcbmode:type="%s"]'
+    xpath_expr_place = './/svg:g[@pcbmode:type="%s"]'
 
     for pcb_layer in config.stk['surface-layer-names']:
+
+        placement_sheets = board_svg.getSheets('placement', pcb_layer)
         
         # Find all 'component' markers
-        markers = svg_in.findall(xpath_expr_place % (pcb_layer, 'component'), 
-                                 namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                             'svg':config.cfg['ns']['svg']})
+        markers = []
+        for sheet in placement_sheets:
+            markers += sheet.findall(xpath_expr_place % 'component', 
+                                     namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                                 'svg':config.cfg['ns']['svg']})
         # Find all 'shape' markers
-        markers += svg_in.findall(xpath_expr_place % (pcb_layer, 'shape'), 
-                                  namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                              'svg':config.cfg['ns']['svg']})
+        for sheet in placement_sheets:
+            markers += sheet.findall(xpath_expr_place % 'shape', 
+                                     namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                                 'svg':config.cfg['ns']['svg']})
 
         for marker in markers:
 
@@ -115,14 +121,16 @@ def extractComponents(svg_in):
 
 
 
-def extractRefdefs(svg_in):
+def extractRefdefs(board_svg):
     """
     """
 
-    xpath_refdefs = '//svg:g[@pcbmode:sheet="silkscreen"]//svg:g[@pcbmode:type="refdef"]'
-    refdefs_elements = svg_in.findall(xpath_refdefs, 
-                             namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                         'svg':config.cfg['ns']['svg']})
+    xpath_refdefs = './/svg:g[@pcbmode:type="refdef"]'
+    refdefs_elements = []
+    for sheet in board_svg.getSheets('silkscreen'):
+        refdefs_elements += sheet.findall(xpath_refdefs, 
+                                          namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                                      'svg':config.cfg['ns']['svg']})
 
     for refdef_element in refdefs_elements:
  
@@ -195,7 +203,7 @@ def extractRefdefs(svg_in):
 
 
 
-def extractRouting(svg_in):
+def extractRouting(board_svg):
     """
     Extracts routing from the the 'routing' SVG layers of each PCB layer.
     Inkscape SVG layers for each PCB ('top', 'bottom', etc.) layer.
@@ -219,14 +227,16 @@ def extractRouting(svg_in):
     routing_dict = {}
 
     # The XPATH expression for extracting routes, but not vias
-    xpath_expr = "//svg:g[@pcbmode:pcb-layer='%s']//svg:g[@pcbmode:sheet='routing']//svg:path[(@d) and not (@pcbmode:type='via')]"
+    xpath_expr = ".//svg:path[(@d) and not (@pcbmode:type='via')]"
 
     routes_dict = {}
 
     for pcb_layer in config.stk['layer-names']:
-        routes = svg_in.xpath(xpath_expr % pcb_layer, 
-                              namespaces={'pcbmode':config.cfg['ns']['pcbmode'], 
-                                          'svg':config.cfg['ns']['svg']})
+        routes = []
+        for sheet in board_svg.getSheets('routing', pcb_layer):
+            routes += sheet.xpath(xpath_expr, 
+                                  namespaces={'pcbmode':config.cfg['ns']['pcbmode'], 
+                                              'svg':config.cfg['ns']['svg']})
 
         for route in routes:
             route_dict = {}
@@ -307,16 +317,18 @@ def extractRouting(svg_in):
     # Extract vias
     #-------------------------------
 
-    xpath_expr_place = '//svg:g[@pcbmode:pcb-layer="%s"]//svg:g[@pcbmode:sheet="placement"]//svg:g[@pcbmode:type="via"]'
+    xpath_expr_place = './/svg:g[@pcbmode:type="via"]'
 
     vias_dict = {}
 
     for pcb_layer in config.stk['surface-layer-names']:
         
         # Find all markers
-        markers = svg_in.findall(xpath_expr_place % pcb_layer, 
-                                 namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                             'svg':config.cfg['ns']['svg']})
+        markers = []
+        for sheet in board_svg.getSheets('placement', pcb_layer):
+            markers += sheet.findall(xpath_expr_place, 
+                                     namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                                 'svg':config.cfg['ns']['svg']})
 
         for marker in markers:
             transform_data = utils.parseTransform(marker.get('transform'))
@@ -387,17 +399,19 @@ def extractRouting(svg_in):
 
 
 
-def extractDocs(svg_in):
+def extractDocs(board_svg):
     """
     Extracts the position of the documentation elements and updates
     the board's json
     """
 
     # Get copper refdef shape groups from SVG data
-    xpath_expr = '//svg:g[@pcbmode:sheet="documentation"]//svg:g[@pcbmode:type="module-shapes"]'
-    docs = svg_in.findall(xpath_expr, 
-                          namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                      'svg':config.cfg['ns']['svg']})
+    xpath_expr = './/svg:g[@pcbmode:type="module-shapes"]'
+    docs = []
+    for sheet in board_svg.getSheets('documentation'):
+        docs += sheet.findall(xpath_expr, 
+                              namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                          'svg':config.cfg['ns']['svg']})
 
     
     for doc in docs:
@@ -413,10 +427,14 @@ def extractDocs(svg_in):
 
 
     # Extract drill index location
-    xpath_expr = '//svg:g[@pcbmode:sheet="drills"]//svg:g[@pcbmode:type="drill-index"]'
-    drill_index = svg_in.find(xpath_expr, 
-                              namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
-                                          'svg':config.cfg['ns']['svg']})    
+    xpath_expr = './/svg:g[@pcbmode:type="drill-index"]'
+    drill_index = None
+    for sheet in board_svg.getSheets('drills'):
+        drill_index = sheet.find(xpath_expr, 
+                                 namespaces={'pcbmode':config.cfg['ns']['pcbmode'],
+                                             'svg':config.cfg['ns']['svg']})
+        if drill_index is not None:
+            break
     transform_dict = utils.parseTransform(drill_index.get('transform'))
     location = transform_dict['location']
     location.y *= config.cfg['invert-y']
@@ -0,0 +1,147 @@
+#!/usr/bin/python
+
+import os
+import hashlib
+from lxml import etree as et
+
+from pkg_resources import resource_exists, resource_filename
+
+import pcbmode.config as config
+from . import messages as msg
+
+
+
+# Fonts that have been parsed in this process, by font family
+_fonts = {}
+
+
+
+
+def getFont(family):
+    """
+    Returns the Font of font family 'family', which is only parsed
+    the first time it's asked for
+    """
+    font = _fonts.get(family)
+    if font is None:
+        font = Font(family)
+        _fonts[family] = font
+    return font
+
+
+
+
+class Font():
+    """
+    An SVG font, with its glyphs indexed by their unicode character
+    """
+
+    def __init__(self, family):
+
+        self._family = family
+        font_filename = "%s.svg" % family
+
+        # Search for the font SVG in these paths
+        paths = [os.path.join(config.cfg['base-dir'],
+                              config.cfg['locations']['fonts'],
+                              font_filename)]
+
+        font_resource = ('pcbmode', '/'.join(['fonts',font_filename]))
+        if resource_exists(*font_resource):
+            paths.append(resource_filename(*font_resource))
+
+        filenames = ''
+        font_data = None
+        for path in paths:
+            filename = path
+            filenames += "  %s \n" % filename
+            if os.path.isfile(filename):
+                # The file is read once, both to be hashed and parsed
+                with open(filename, 'rb') as f:
+                    data = f.read()
+                self._file_digest = hashlib.md5(data).hexdigest()
+                font_data = et.ElementTree(et.fromstring(data))
+                break
+
+        if font_data == None:
+            msg.error("Couldn't find font file %s. Looked for it here:\n%s" % (font_filename, filenames))
+
+        ns = {'n': config.cfg['namespace']['svg']}
+
+        # This the horizontal advance that applied to all glyphs unless
+        # there's a specification for the glyph itself
+        self._horiz_adv_x = float(font_data.find(".//n:font", namespaces=ns).get('horiz-adv-x'))
+
+        # This is the number if 'units' per 'em'. The default, in the
+        # absence of a definition is 1000 according to the SVG spec
+        font_face = font_data.find(".//n:font-face", namespaces=ns)
+        self._units_per_em = float(font_face.get('units-per-em') or 1000)
+        self._ascent = float(font_face.get('ascent'))
+        self._descent = float(font_face.get('descent'))
+
+        # Glyph records. The path is made relative the first time the
+        # glyph is used; see getGlyph()
+        self._glyphs = {}
+        for glyph in font_data.iterfind(".//n:glyph", namespaces=ns):
+            symbol = glyph.get('unicode')
+            # The first definition of a glyph is the one that's used
+            if symbol is None or symbol in self._glyphs:
+                continue
+            self._glyphs[symbol] = {
+                'horiz-adv-x': float(glyph.get('horiz-adv-x') or self._horiz_adv_x),
+                'gerber-lp': glyph.get('gerber-lp') or glyph.get('gerber_lp'),
+                'd': glyph.get('d')
+            }
+
+
+
+    def getGlyph(self, symbol):
+        """
+        Returns the record of the glyph for 'symbol', which has its
+        horizontal advance, 'horiz-adv-x'. Unless the glyph is empty,
+        it also has the glyph's path relative to its first point,
+        'relative', the first point, 'first-point', and its 'gerber-lp'.
+        """
+
+        glyph = self._glyphs.get(symbol)
+        if glyph is None:
+            msg.error("Damn, there's no glyph definition for '%s' in the '%s' font :(" % (symbol, self._family))
+
+        if glyph.get('d') not in [None, ''] and glyph.get('relative') is None:
+            from .svgpath import SvgPath
+            glyph_path = SvgPath(glyph['d'])
+            glyph['first-point'] = [float(c) for c in glyph_path.getFirstPoint()]
+            glyph['relative'] = glyph_path.getRelative()
+            if glyph['gerber-lp'] is None:
+                glyph['gerber-lp'] = 'd'*glyph_path.getNumberOfSegments()
+
+        return glyph
+
+
+
+    def getFamily(self):
+        return self._family
+
+
+    def getFileDigest(self):
+        """
+        Returns the digest of the font's file, which changes when the
+        font is edited
+        """
+        return self._file_digest
+
+
+    def getHorizAdvX(self):
+        return self._horiz_adv_x
+
+
+    def getUnitsPerEm(self):
+        return self._units_per_em
+
+
+    def getAscent(self):
+        return self._ascent
+
+
+    def getDescent(self):
+        return self._descent
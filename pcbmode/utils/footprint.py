@@ -38,6 +38,10 @@ class Footprint():
                         'solderpaste': {},
                         'drills': {}}
 
+        # Shapes of pads, which are copied for every pin that uses
+        # them; see _getPadShape()
+        self._pad_shapes = {}
+
         self._processPins()
         self._processPours()
         self._processShapes()
@@ -51,6 +55,20 @@ class Footprint():
 
 
 
+    def getShapesCopy(self):
+        """
+        Returns the shapes as getShapes() does, but copies of them, so
+        that each component using the footprint can transform its own
+        """
+        shapes = {}
+        for sheet in self._shapes:
+            shapes[sheet] = {}
+            for layer in self._shapes[sheet]:
+                shapes[sheet][layer] = [shape.copy() for shape in self._shapes[sheet][layer]]
+        return shapes
+
+
+
     def _processPins(self):
         """
         Converts pins into 'shapes'
@@ -77,7 +95,7 @@ class Footprint():
 
             shapes = pad_dict.get('shapes') or []
 
-            for shape_dict in shapes:
+            for si, shape_dict in enumerate(shapes):
 
                 shape_dict = shape_dict.copy()
 
@@ -99,9 +117,8 @@ class Footprint():
 
                 for layer in layers:
                     
-                    shape = Shape(shape_dict)
-                    style = Style(shape_dict, 'conductor')
-                    shape.setStyle(style)
+                    shape = self._getPadShape((pad_name, si, pin_rotate, 'conductor'),
+                                              shape_dict, 'conductor')
                     try:
                         self._shapes['conductor'][layer].append(shape)
                     except:
@@ -122,25 +139,36 @@ class Footprint():
                             # Which shape type is the pad?
                             shape_type = shape.getType()
 
+                            # The shape is derived from the pad's
+                            # shape, scaled by this much, unless it has
+                            # to be made from the new dictionary
+                            derive_scale = None
+
                             # Apply modifier based on shape type
                             if shape_type == 'path':
                                 sdict['scale'] = shape.getScale()*config.brd['distances'][stype]['path-scale']
+                                derive_scale = (1, 1)
                             elif shape_type in ['rect', 'rectangle']:
                                 sdict['width'] += config.brd['distances'][stype]['rect-buffer']
                                 sdict['height'] += config.brd['distances'][stype]['rect-buffer']
+                                # Rounded corners would be scaled as well
+                                radii = sdict.get('radii') or {}
+                                if (float(shape_dict['width']) != 0 and float(shape_dict['height']) != 0 and
+                                    all(r == 0 for r in radii.values())):
+                                    derive_scale = (float(sdict['width'])/float(shape_dict['width']),
+                                                    float(sdict['height'])/float(shape_dict['height']))
                             elif shape_type in ['circ', 'circle']:
                                 sdict['diameter'] += config.brd['distances'][stype]['circle-buffer']
+                                if float(shape_dict['diameter']) != 0:
+                                    ratio = float(sdict['diameter'])/float(shape_dict['diameter'])
+                                    derive_scale = (ratio, ratio)
                             else:
                                 pass
 
                             # Create shape based on new dictionary
-                            sshape = Shape(sdict)
-
-                            # Define style
-                            sstyle = Style(sdict, stype)
-
-                            # Apply style
-                            sshape.setStyle(sstyle)
+                            sshape = self._getPadShape((pad_name, si, pin_rotate, stype),
+                                                       sdict, stype,
+                                                       shape, derive_scale)
 
                             # Add shape to footprint's shape dictionary
                             #self._shapes[stype][layer].append(sshape)
@@ -166,7 +194,7 @@ class Footprint():
                                 sdict_list = [sdict_list]
 
                             # Process list of shapes
-                            for sdict_ in sdict_list:
+                            for mi, sdict_ in enumerate(sdict_list):
                                 sdict = sdict_.copy()
                                 shape_loc = utils.toPoint(sdict.get('location') or [0, 0])
 
@@ -180,13 +208,8 @@ class Footprint():
                                                      shape_loc.y + pin_location[1]]
 
                                 # Create new shape
-                                sshape = Shape(sdict)
-     
-                                # Create new style
-                                sstyle = Style(sdict, stype)
-                                
-                                # Apply style
-                                sshape.setStyle(sstyle)
+                                sshape = self._getPadShape((pad_name, si, pin_rotate, stype, mi),
+                                                           sdict, stype)
      
                                 # Add shape to footprint's shape dictionary
                                 #self._shapes[stype][layer].append(sshape)
@@ -205,15 +228,14 @@ class Footprint():
 
 
             drills = pad_dict.get('drills') or []
-            for drill_dict in drills:
+            for di, drill_dict in enumerate(drills):
                 drill_dict = drill_dict.copy()
                 drill_dict['type'] = drill_dict.get('type') or 'drill'
                 drill_location = drill_dict.get('location') or [0, 0]
                 drill_dict['location'] = [drill_location[0] + pin_location[0],
                                           drill_location[1] + pin_location[1]]
-                shape = Shape(drill_dict)
-                style = Style(drill_dict, 'drills')
-                shape.setStyle(style)
+                shape = self._getPadShape((pad_name, di, 'drills'),
+                                          drill_dict, 'drills')
                 try:
                     self._shapes['drills']['top'].append(shape)
                 except:
@@ -224,6 +246,35 @@ class Footprint():
 
 
 
+    def _getPadShape(self, key, shape_dict, sheet, pad_shape=None, derive_scale=None):
+        """
+        Returns a new Shape of 'shape_dict' on 'sheet', with its style.
+        The shapes of a pad only differ by their location from pin to
+        pin, so the shape for each 'key' is only made once and then
+        copied, and only the location is taken from 'shape_dict'.
+
+        With a 'derive_scale', the shape is derived from the pad's
+        shape, 'pad_shape', by scaling it (see Shape.derive()) instead
+        of being made from scratch.
+        """
+        shape = self._pad_shapes.get(key)
+        if shape is None:
+            if derive_scale is not None:
+                shape = pad_shape.derive(shape_dict, *derive_scale)
+            else:
+                shape = Shape(shape_dict)
+            shape.setStyle(Style(shape_dict, sheet))
+            self._pad_shapes[key] = shape
+
+        shape = shape.copy()
+        shape.setLocation(utils.toPoint(shape_dict.get('location', [0, 0])))
+
+        return shape
+
+
+
+
+
     def _processPours(self):
         """
         """
@@ -2,6 +2,8 @@
 
 import os
 import re
+import math
+import time
 from lxml import etree as et
 import pyparsing as pyp
 
@@ -11,32 +13,96 @@ from . import messages as msg
 # pcbmode modules
 from . import svg
 from . import utils
+from . import affine
 from .svgpath import SvgPath
+from .boardsvg import getBoardSvg, TransformResolver
 from .point import Point
 
 
 
-def gerberise(manufacturer='default'):
+# An aperture selection command
+_aperture_select = re.compile(r"D\d+\*\n?$")
+
+# Regular expressions that convert the fractions of numbers formatted
+# with '%f' to Gerber's number of decimals; see encodeCoords()
+_fractions = {}
+
+
+
+
+def encodeCoords(values, offset, decimals, first, rest):
     """
-    Generate Gerbers for one or more layers
+    Returns the Gerber records of a polyline in one string. 'values'
+    are the 'x' and 'y' coordinates of its points, which are moved by
+    the 'offset' Point. The first point is formatted with 'first' and
+    the others with 'rest', which have a '%f' for 'x' and one for 'y'.
+
+    Coordinates are rounded as by Point, formatted all at once with
+    '%f' and then have their decimal point removed and their fraction
+    cut, or padded with zeros, to 'decimals' digits. Leading zeros
+    are left as '%f' makes them.
+    """
+
+    n = len(values) // 2
+    if n == 0:
+        return ''
+
+    sig_dig = config.cfg['significant-digits']
+    ox = offset.x
+    oy = offset.y
+
+    # Gerber's 'y' goes up
+    flat = []
+    for i in range(0, 2*n, 2):
+        flat.append(round(values[i] + ox, sig_dig))
+        flat.append(-round(values[i+1] + oy, sig_dig))
+
+    records = (first + rest*(n-1)) % tuple(flat)
+
+    # '%f' always has six decimals
+    if decimals == 6:
+        return records.replace('.', '')
+
+    fraction = _fractions.get(decimals)
+    if fraction is None:
+        if decimals < 6:
+            fraction = (re.compile(r"\.(\d{%d})\d*" % decimals), r"\1")
+        else:
+            fraction = (re.compile(r"\.(\d{6})"), r"\g<1>" + '0'*(decimals-6))
+        _fractions[decimals] = fraction
+
+    return fraction[0].sub(fraction[1], records)
+
+
+
+
+def gerberise(manufacturer='default', svg_tree=None):
+    """
+    Generate Gerbers for one or more layers. 'svg_tree' is the board's
+    SVG if it was made in this run; otherwise it's read from the file.
     """
 
     # Open the board's SVG
-    svg_in = utils.openBoardSVG()
+    board_svg = getBoardSvg(svg_tree)
+
+    for job in getGerberJobs(manufacturer, board_svg):
+        start = time.time()
+        changes = writeGerber(job, board_svg)
+        msg.subInfo("%s (%.2fs)" % (os.path.basename(job['filename']),
+                                     time.time() - start))
+        reportChanges(job['filename'], changes)
 
-    # Get Gerber generation settings
-    gcd = config.brd['gerber']
-    decimals = gcd['decimals']
-    digits = gcd['digits'] 
-    steps = gcd['steps-per-segment']
-    length = gcd['min-segment-length']
 
-    # Get layer data
-    xpath_regex = ""
-    ns = {'pcbmode':config.cfg['ns']['pcbmode'],
-          'svg':config.cfg['ns']['svg']} 
 
 
+def getGerberJobs(manufacturer, board_svg):
+    """
+    Returns a job for each Gerber of the board, which writeGerber()
+    makes. Jobs are independent of each other, and have the Gerber's
+    'filename', and the 'sheet', and 'pcb-layer' if it's in one, that
+    the Gerber is made of.
+    """
+
     # Save to file
     base_dir = os.path.join(config.cfg['base-dir'], 
                             config.cfg['locations']['build'], 
@@ -48,78 +114,126 @@ def gerberise(manufacturer='default'):
  
     filename_info = config.cfg['manufacturers'][manufacturer]['filenames']['gerbers']
 
+    jobs = []
+
     # Process Gerbers for PCB layers and sheets
     #for pcb_layer in utils.getSurfaceLayers():
     for pcb_layer in config.stk['layer-names']:
 
-        # Get the SVG layer corresponding to the PCB layer
-        svg_layer = svg_in.find("//svg:g[@pcbmode:pcb-layer='%s']" % (pcb_layer),
-                                namespaces=ns)
-
-        # Get masks (must be placed right after pours)
-        mask_paths = svg_in.findall(".//svg:defs//svg:mask[@pcbmode:pcb-layer='%s']//svg:path" % pcb_layer,
-                                       namespaces=ns)
-
         sheets = ['conductor', 'soldermask', 'solderpaste', 'silkscreen']
         for sheet in sheets:
-            # Get the SVG layer corresponding to the 'sheet'
-            sheet_layer = svg_layer.find(".//svg:g[@pcbmode:sheet='%s']" % (sheet),
-                                         namespaces=ns)
-
-            if sheet == 'conductor':
-                mask_paths_to_pass = mask_paths
-            else:
-                mask_paths_to_pass = []
-
-            if sheet_layer != None:
-                # Create a Gerber object
-                gerber = Gerber(sheet_layer,
-                                mask_paths_to_pass,
-                                decimals,
-                                digits,
-                                steps,
-                                length)
-
-                # Default to .ger extension if undefined
-                try:
-                    ext = filename_info[pcb_layer.split('-')[0]][sheet].get('ext')
-                except KeyError:
-                    ext = 'ger'
+            # Only sheets that are in the SVG are made
+            if board_svg.getSheet(sheet, pcb_layer) is None:
+                continue
 
-                add = '_%s_%s.%s' % (pcb_layer, sheet, ext)
+            # Default to .ger extension if undefined
+            try:
+                ext = filename_info[pcb_layer.split('-')[0]][sheet].get('ext')
+            except KeyError:
+                ext = 'ger'
 
-                filename = os.path.join(base_dir, base_name + add)
-     
-                with open(filename, "wb") as f:
-                    for line in gerber.getGerber():
-                        f.write(line)
+            add = '_%s_%s.%s' % (pcb_layer, sheet, ext)
 
+            jobs.append({'type': 'gerber',
+                         'filename': os.path.join(base_dir, base_name + add),
+                         'pcb-layer': pcb_layer,
+                         'sheet': sheet})
 
     # Process module sheets
     sheets = ['outline', 'documentation']
     for sheet in sheets:
-        # Get the SVG layer corresponding to the 'sheet'
-        sheet_layer = svg_in.find(".//svg:g[@pcbmode:sheet='%s']" % (sheet),
-                                  namespaces=ns)            
-
-        # Create a Gerber object
-        gerber = Gerber(sheet_layer,
-                        [],
-                        decimals,
-                        digits,
-                        steps,
-                        length)
-
         add = '_%s.%s' % (sheet,
                           filename_info['other'][sheet].get('ext') or 'ger')
-        filename = os.path.join(base_dir, base_name + add)
 
-        with open(filename, "wb") as f:
-            for line in gerber.getGerber(False):
-                f.write(line)
+        jobs.append({'type': 'gerber',
+                     'filename': os.path.join(base_dir, base_name + add),
+                     'pcb-layer': None,
+                     'sheet': sheet})
+
+    return jobs
+
+
+
+
+def getGerberJobElements(job, board_svg):
+    """
+    Returns the elements of the board's SVG that the Gerber of 'job' is
+    made of
+    """
+    elements = [board_svg.getSheet(job['sheet'], job['pcb-layer'])]
+    if job['sheet'] == 'conductor':
+        mask = board_svg.getMask(job['pcb-layer'])
+        if mask is not None:
+            elements.append(mask)
+    return elements
 
 
-    return ['bullshit']
+
+
+def writeGerber(job, board_svg):
+    """
+    Makes the Gerber of a job from getGerberJobs() and writes it.
+    Returns the changes of polarity and aperture before and after
+    reordering, or None if it isn't reordered, for reportChanges()
+    """
+
+    # Get Gerber generation settings
+    gcd = config.brd['gerber']
+    decimals = gcd['decimals']
+    digits = gcd['digits'] 
+    steps = gcd['steps-per-segment']
+    length = gcd['min-segment-length']
+
+    ns = {'pcbmode':config.cfg['ns']['pcbmode'],
+          'svg':config.cfg['ns']['svg']} 
+
+    pcb_layer = job['pcb-layer']
+    sheet = job['sheet']
+
+    # Get the SVG layer corresponding to the 'sheet'
+    sheet_layer = board_svg.getSheet(sheet, pcb_layer)
+
+    # Get masks (must be placed right after pours)
+    mask_paths = []
+    if sheet == 'conductor':
+        mask = board_svg.getMask(pcb_layer)
+        if mask is not None:
+            mask_paths = mask.findall(".//svg:path", namespaces=ns)
+
+    # Create a Gerber object
+    gerber = Gerber(sheet_layer,
+                    mask_paths,
+                    decimals,
+                    digits,
+                    steps,
+                    length,
+                    board_svg.getTransforms(),
+                    gcd.get('compact') or False,
+                    gcd.get('reorder') or False,
+                    gcd.get('flash-pads') or False)
+
+    # Module sheets don't have pad flashes
+    flashes = pcb_layer is not None
+
+    # The Gerber is written as it's made
+    with open(job['filename'], "wb", 1024*1024) as f:
+        f.writelines(gerber.getGerber(flashes))
+
+    return gerber.getChanges()
+
+
+
+
+def reportChanges(filename, changes):
+    """
+    Prints the changes of polarity and aperture that writeGerber()
+    returns for a reordered Gerber; 'changes' is None otherwise
+    """
+    if changes is not None:
+        before, after = changes
+        msg.subInfo("%s: polarity changes %d -> %d, aperture changes %d -> %d" %
+                    (os.path.basename(filename),
+                     before[0], after[0], before[1], after[1]))
 
 
 
@@ -137,8 +251,19 @@ class Gerber():
                  decimals,
                  digits,
                  steps,
-                 length):
+                 length,
+                 transforms=None,
+                 compact=False,
+                 reorder=False,
+                 flash_pads=False):
         """
+        'transforms' is the TransformResolver of the document. With
+        'compact', commands and coordinates that are already the
+        current ones are left out; see _compactLines(). With 'reorder',
+        paths are drawn in an order that has fewer changes of polarity
+        and aperture; see _reorderSegments(). With 'flash_pads', pads
+        and shapes that are rectangles or circles are flashed with an
+        aperture of their shape; see _getFlashAperture().
         """
 
         self._ns = {'pcbmode':config.cfg['ns']['pcbmode'],
@@ -150,6 +275,13 @@ class Gerber():
         self._digits = digits
         self._steps = steps
         self._length = length
+        self._compact = compact
+        self._reorder = reorder
+        self._flash_pads = flash_pads
+        self._changes = None
+        self._transforms = transforms
+        if self._transforms is None:
+            self._transforms = TransformResolver()
         self._grammar = self._getGerberGrammar()
 
         self._aperture_list = []
@@ -164,38 +296,39 @@ class Gerber():
         self._closed_shape_aperture_num = 10
         self._pad_flashes_aperture_num = 11
 
-        self._commands = []
         self._apertures = {}
 
         self._paths = self._getPaths()
 
+        # The apertures are defined in the preamble, so they're
+        # collected before any of the paths' commands are made; see
+        # getGerber()
         for path in self._paths:
-            tmp = {}
-
-            style_string = path.get('style')
-            tmp['style'] = path.get('{'+config.cfg['ns']['pcbmode']+'}style')
-            if tmp['style'] == 'stroke':
-                tmp['stroke-width'] = utils.getStyleAttrib(style_string, 'stroke-width')
+            style = path.get('{'+config.cfg['ns']['pcbmode']+'}style')
+            if style == 'stroke':
+                stroke_width = utils.getStyleAttrib(path.get('style'), 'stroke-width')
                 # Build aperture list
-                if tmp['stroke-width'] not in self._apertures:
-                    self._apertures[tmp['stroke-width']] = self._aperture_num
+                if stroke_width not in self._apertures:
+                    self._apertures[stroke_width] = self._aperture_num
                     self._aperture_num += 1
 
-            tmp['gerber-lp'] = path.get('{'+config.cfg['ns']['pcbmode']+'}gerber-lp')
-
-            # Get the absolute location 
-            location = self._getLocation(path)
-
-            # Get path coordinates; each path segment as a list item
-            tmp['coords'] = self._getCommandListOfPath(path, location)
+        # Apertures of flashed paths, by their template and dimensions,
+        # and the aperture each flashed path uses
+        self._flash_apertures = {}
+        self._flashed = {}
+        if self._flash_pads == True:
+            for path in self._flashable:
+                # Apertures are only moved, not rotated or scaled
+                if not affine.isTranslation(self._transforms.getMatrix(path)):
+                    continue
+                aperture = self._getFlashAperture(path)
+                if aperture is None:
+                    continue
+                if aperture not in self._flash_apertures:
+                    self._flash_apertures[aperture] = self._aperture_num
+                    self._aperture_num += 1
+                self._flashed[path] = self._flash_apertures[aperture]
 
-            self._commands.append(tmp)
-        
-        self._flattenCoords()
-        self._flashes = self._getFlashes()
-        self._preamble = self._createPreamble()
-        self._postamble = self._createPostamble()
-        
 
 
 
@@ -205,27 +338,27 @@ class Gerber():
         Manufacturers use the coordinate of a flash of pads as coordinates
         for continuity tests when boards are testes. Typically, a pad
         is created using a flash. Since PCBmodE doesn't flash a pad,
-        we add tiny dots in the center of the pads.
+        we add tiny dots in the center of the pads, unless the pad was
+        flashed with an aperture of its shape.
         """
 
-        fc = []
-        fc.append("\n")        
-        fc.append("G04 Pad flashes *\n")        
-        fc.append("%LPD*%\n")
-        fc.append("D%d*\n" % self._pad_flashes_aperture_num)
+        yield "\n"
+        yield "G04 Pad flashes *\n"
+        yield "%LPD*%\n"
+        yield "D%d*\n" % self._pad_flashes_aperture_num
 
         # Get pads
         pad_paths = self._svg.findall(".//svg:g[@pcbmode:sheet='pads']//svg:path",
                                       namespaces=self._ns)        
         
         for pad_path in pad_paths:
+            if pad_path in self._flashed:
+                continue
             location = self._getLocation(pad_path)
             text = self._getGerberisedPoint(location, Point())
-            fc.append("%sD03*\n" % text)            
+            yield "%sD03*\n" % text
         
-        fc.append("\n")        
-
-        return fc
+        yield "\n"
 
 
 
@@ -235,24 +368,7 @@ class Gerber():
         its ancestors, and its own transform
         """
 
-        location = Point()
-
-        # We need to get the transforms of all ancestors that have
-        # one in order to get the location correctly
-        ancestors = path.xpath("ancestor::*[@transform]")
-        for ancestor in ancestors:
-            transform = ancestor.get('transform')
-            transform_data = utils.parseTransform(transform)
-            # Add them up
-            location += transform_data['location']
-
-        # Add the transform of the path itself
-        transform = path.get('transform')
-        if transform != None:
-            transform_data = utils.parseTransform(transform)
-            location += transform_data['location']        
-
-        return location
+        return self._transforms.getLocation(path)
 
 
 
@@ -287,12 +403,18 @@ class Gerber():
                                      namespaces=self._ns)
 
         # Get pads (applies to copper only, otherwise empty list)
-        paths += self._svg.findall(".//svg:g[@pcbmode:sheet='pads']//svg:path",
-                                     namespaces=self._ns)
+        pads = self._svg.findall(".//svg:g[@pcbmode:sheet='pads']//svg:path",
+                                 namespaces=self._ns)
+        paths += pads
 
         # Get component shapes
-        paths += self._svg.findall(".//svg:g[@pcbmode:type='component-shapes']//svg:path",
-                                     namespaces=self._ns)
+        shapes = self._svg.findall(".//svg:g[@pcbmode:type='component-shapes']//svg:path",
+                                   namespaces=self._ns)
+        paths += shapes
+
+        # Only pads and component shapes, which include the pads'
+        # soldermask and solderpaste, are flashed
+        self._flashable = pads + shapes
 
         # Get refdefs
         paths += self._svg.findall(".//svg:g[@pcbmode:type='refdef']//svg:path",
@@ -316,37 +438,185 @@ class Gerber():
 
     def getGerber(self, flashes=True):
         """
-        Return the complete Gerber
+        Generates the lines of the complete Gerber. The commands of the
+        paths are made as the lines are asked for, so that only those
+        of one path are kept at a time, unless they're reordered.
         """
-        if flashes == True:
-            gerber = (self._preamble+
-                      self._flattened_commands+
-                      self._flashes+
-                      self._postamble)
+        for line in self._createPreamble():
+            yield line
+
+        if self._compact == True:
+            for line in self._compactLines(self._getOperations(flashes)):
+                yield line
         else:
-            gerber = (self._preamble+
-                      self._flattened_commands+
-                      self._postamble)
-        
-        return gerber
+            for line in self._getOperations(flashes):
+                yield line
+
+        for line in self._createPostamble():
+            yield line
+
+
+
+    def _getOperations(self, flashes):
+        """
+        Generates the commands of the paths, and the pad flashes if
+        'flashes' is True
+        """
+        for line in self._getCommands():
+            yield line
+
+        if flashes == True:
+            for line in self._getFlashes():
+                yield line
 
 
 
+    def _compactLines(self, lines):
+        """
+        Filters the Gerber 'lines' so that 'G01' is only set once since
+        it's modal, coordinates are only given when they change, and
+        apertures are only selected when they aren't already the
+        current one. Strings with more than one line are split.
+        """
+
+        interpolation = False
+        aperture = None
+        last_x = None
+        last_y = None
+
+        for text in lines:
+            for line in text.splitlines(True):
+
+                coords = line
+                if line.startswith('G01X'):
+                    coords = line[3:]
+
+                if coords.startswith('X'):
+                    y = coords.index('Y')
+                    d = coords.index('D', y)
+                    x_word = coords[:y]
+                    y_word = coords[y:d]
+
+                    record = ''
+                    if line.startswith('G01') and interpolation == False:
+                        record = 'G01'
+                        interpolation = True
+                    # Keep at least one coordinate so that every
+                    # operation has one
+                    if x_word != last_x or y_word == last_y:
+                        record += x_word
+                    if y_word != last_y:
+                        record += y_word
+                    last_x = x_word
+                    last_y = y_word
+
+                    yield record + coords[d:]
+
+                elif _aperture_select.match(line):
+                    if line != aperture:
+                        aperture = line
+                        yield line
+
+                else:
+                    yield line
+
+
+
+
+
+    def getChanges(self):
+        """
+        Returns the number of polarity and aperture changes before and
+        after the paths were reordered, as ((polarity, aperture),
+        (polarity, aperture)), or None if they weren't
+        """
+        return self._changes
+
+
 
 
-    def _flattenCoords(self):
+    def _getCommands(self):
         """
+        Generates the commands of all the paths, one path at a time
         """
 
+        segments = self._getSegments()
+        if self._reorder == True:
+            segments = self._reorderSegments(segments)
+
         # This is left intentionally 'empty' in order for it to be
         # set the first time
         current_polarity = ''
 
-        commands = []
-        for cmd_set in self._commands:
-            gerber_lp = cmd_set.get('gerber-lp')
+        for polarity, aperture, commands, box in segments:
+
+            # Change the polarity of neccessary
+            if polarity != current_polarity:
+                yield "%%LP%s*%%\n" % polarity
+                current_polarity = polarity
+
+            if aperture is None:
+                # Start of a closed shape
+                yield "G36*\n"
+            else:
+                # Chahge aperture to match stroke width, or to flash
+                # the shape
+                yield "D%d*\n" % aperture
+
+            # Add the path segment's commands
+            yield commands
+
+            if aperture is None:
+                # Close the 'closed' shape
+                yield "G37*\n"
+
+
+
+    def _getSegments(self):
+        """
+        Generates a (polarity, aperture, commands, box) tuple for each
+        segment of every path, in the order they're drawn. 'aperture'
+        is None for closed shapes, and 'box' is the bounding box of
+        what the segment draws when segments are reordered.
+        """
+
+        for path in self._paths:
+            if path in self._flashed:
+                yield self._getFlashSegment(path)
+                continue
+
+            style = path.get('{'+config.cfg['ns']['pcbmode']+'}style')
+            if style == 'stroke':
+                stroke_width = utils.getStyleAttrib(path.get('style'), 'stroke-width')
+                aperture = self._apertures[stroke_width]
+                # Strokes reach half their width beyond the path
+                margin = float(stroke_width) / 2
+            else:
+                aperture = None
+                margin = 0
 
-            for i, cmd_list in enumerate(cmd_set['coords']):
+            # Coordinates are rounded to the Gerber's decimals
+            margin += pow(10.0, -self._decimals)
+
+            gerber_lp = path.get('{'+config.cfg['ns']['pcbmode']+'}gerber-lp')
+
+            # Get the absolute location, and whatever rotation, scale,
+            # etc. the transforms of the path and its ancestors add,
+            # which is applied to the path's points
+            matrix = self._transforms.getMatrix(path)
+            location = Point(matrix[4], matrix[5])
+            linear = None
+            if not affine.isTranslation(matrix):
+                if style == 'stroke' and not affine.isRigid(matrix):
+                    msg.error("A stroked path can only be rotated or mirrored by its transforms, not scaled or skewed, since its stroke width would change: %s" % path.get('d')[:50])
+                linear = matrix
+
+            # Each 'segment' correspond to a shape within the complete
+            # poth.
+            for i, segment in enumerate(self._pathToPoints(path)):
+
+                if linear is not None:
+                    segment = affine.applyToValues(linear, segment)
 
                 # Get the polarity setting character from the string,
                 # corresponding to the current path segment being
@@ -356,97 +626,257 @@ class Gerber():
                 except:
                     polarity = 'D'
 
-                # Change the polarity of neccessary
-                if polarity != current_polarity:
-                    commands.append("%%LP%s*%%\n" % polarity)
-                    current_polarity = polarity
-
-                if cmd_set['style'] == 'fill':
-                    # Start of a closed shape
-                    commands.append("G36*\n")
-                else:
-                    # Chahge aperture to match stroke width
-                    commands.append("D%d*\n" % self._apertures[cmd_set['stroke-width']])
-
-                # Add the path segment's commands
-                commands += cmd_list
-
-                if cmd_set['style'] == 'fill':
-                    # Close the 'closed' shape
-                    commands.append("G37*\n")
-        
-        self._flattened_commands = commands
-
+                commands = encodeCoords(segment,
+                                        location,
+                                        self._decimals,
+                                        "G01X%fY%fD02*\n",
+                                        "G01X%fY%fD01*\n")
 
+                box = None
+                if self._reorder == True and len(segment) > 0:
+                    xs = segment[0::2]
+                    ys = segment[1::2]
+                    box = (min(xs) + location.x - margin,
+                           min(ys) + location.y - margin,
+                           max(xs) + location.x + margin,
+                           max(ys) + location.y + margin)
 
+                yield polarity, aperture, commands, box
 
 
 
-    def _getParamCommand(self, param, comment=None):
+    def _getFlashSegment(self, path):
         """
-        Returns a list of Gerber parameter command with an optional
-        comment
+        Returns the segment tuple, as _getSegments() does, that flashes
+        'path' with its aperture at the path's location, which is its
+        centre
         """
-        commands = []
-        if comment != None:
-            commands.append('G04 ' + comment + ' *\n')
-        commands.append('%' + param + '*%\n')
- 
-        return commands
+        aperture = self._flashed[path]
+        location = self._getLocation(path)
 
+        gerber_lp = path.get('{'+config.cfg['ns']['pcbmode']+'}gerber-lp')
+        polarity = (gerber_lp or 'd').upper()
 
+        commands = "%sD03*\n" % self._getGerberisedPoint(location, Point())
 
+        box = None
+        if self._reorder == True:
+            margin = pow(10.0, -self._decimals)
+            width = float(path.get('{'+config.cfg['ns']['pcbmode']+'}flash-width'))/2 + margin
+            height = float(path.get('{'+config.cfg['ns']['pcbmode']+'}flash-height'))/2 + margin
+            box = (location.x - width, location.y - height,
+                   location.x + width, location.y + height)
 
+        return polarity, aperture, commands, box
 
-    def _pathToPoints(self, path):
+
+
+    def _getFlashAperture(self, path):
         """
-        Converts a path into points
+        Returns the aperture that flashes 'path', as a tuple of its
+        template, width, height and corner radius, or None if it can't
+        be flashed. Circles use the standard 'C' template, rectangles
+        'R', rectangles with round ends 'O', and rectangles with round
+        corners the 'RoundRect' macro.
         """
-        path = SvgPath(path.get('d'))
-        coords = path.getCoordList(self._steps, 
-                                   self._length)
 
-        return coords
+        ns = '{'+config.cfg['ns']['pcbmode']+'}'
+
+        if path.get(ns+'flash-width') is None:
+            return None
+
+        # Only filled paths with a single segment, the shape's
+        # outline, are flashed
+        gerber_lp = path.get(ns+'gerber-lp') or 'd'
+        if path.get(ns+'style') != 'fill' or len(gerber_lp) != 1:
+            return None
+
+        width = round(float(path.get(ns+'flash-width')), self._decimals)
+        height = round(float(path.get(ns+'flash-height')), self._decimals)
+        radius = round(float(path.get(ns+'flash-radius')), self._decimals)
+
+        if width <= 0 or height <= 0:
+            return None
+        elif radius == 0:
+            return ('R', width, height, radius)
+        elif width == height and radius*2 == width:
+            return ('C', width, height, radius)
+        elif radius*2 == min(width, height):
+            return ('O', width, height, radius)
+        elif radius*2 < min(width, height):
+            return ('RoundRect', width, height, radius)
+        else:
+            return None
 
 
 
+    def _reorderSegments(self, segments):
+        """
+        Returns the 'segments' from _getSegments() reordered so that
+        there are fewer changes of polarity and aperture, without
+        changing the image.
+
+        Segments of the same polarity can be drawn in any order, and so
+        can a dark and a clear segment that don't overlap. Each segment
+        is moved back to the earliest run of segments of its polarity
+        that it can get to without passing a segment of the other
+        polarity whose bounding box overlaps its own. Within each run
+        segments are then grouped by aperture.
+
+        Segments that are already in runs are found by the cells of a
+        grid that their bounding boxes cover, so that a segment is only
+        compared with the ones near it.
+        """
 
-    def _getCommandListOfPath(self, path, offset=Point()):
+        def overlap(a, b):
+            return (a[0] <= b[2] and b[0] <= a[2] and
+                    a[1] <= b[3] and b[1] <= a[3])
+
+        def getCells(box):
+            for i in range(int(math.floor(box[0] / cell_size)),
+                           int(math.floor(box[2] / cell_size)) + 1):
+                for j in range(int(math.floor(box[1] / cell_size)),
+                               int(math.floor(box[3] / cell_size)) + 1):
+                    yield (i, j)
+
+        # Size of the grid's cells in mm
+        cell_size = 2.0
+
+        segments = list(segments)
+
+        # Runs of segments of the same polarity. A segment only starts
+        # a new run when it can't be put in the last one, so runs
+        # alternate in polarity.
+        runs = []
+
+        # The boxes of the segments in runs, by polarity and cell, and
+        # then by the index of their run
+        cells = {}
+
+        # Index of the last run of each polarity with a segment that
+        # has no box, which overlaps everything
+        unbounded = {}
+
+        for segment in segments:
+            polarity = segment[0]
+            box = segment[3]
+
+            # The last run of the other polarity that has a segment
+            # that overlaps this one, which it can't be moved before
+            barrier = -1
+            for other in unbounded:
+                if other != polarity:
+                    barrier = max(barrier, unbounded[other])
+
+            if box is None:
+                for index, run in enumerate(runs):
+                    if run['polarity'] != polarity:
+                        barrier = max(barrier, index)
+            else:
+                for cell in getCells(box):
+                    for other in ('D', 'C'):
+                        if other == polarity or (other, cell) not in cells:
+                            continue
+                        boxes = cells[(other, cell)]
+                        for index in sorted(boxes, reverse=True):
+                            if index <= barrier:
+                                break
+                            if any(overlap(other_box, box) for other_box in boxes[index]):
+                                barrier = index
+                                break
+
+            # The earliest run of this polarity after it
+            index = barrier + 1
+            if index < len(runs) and runs[index]['polarity'] != polarity:
+                index += 1
+            if index == len(runs):
+                runs.append({'polarity': polarity, 'segments': []})
+
+            runs[index]['segments'].append(segment)
+
+            if box is None:
+                unbounded[polarity] = max(unbounded.get(polarity, -1), index)
+            else:
+                for cell in getCells(box):
+                    boxes = cells.setdefault((polarity, cell), {})
+                    boxes.setdefault(index, []).append(box)
+
+        reordered = []
+        aperture = None
+        for run in runs:
+            # Group by aperture in the order they're first used, but
+            # carry on with the one that's current
+            apertures = []
+            groups = {}
+            for segment in run['segments']:
+                if segment[1] not in groups:
+                    groups[segment[1]] = []
+                    apertures.append(segment[1])
+                groups[segment[1]].append(segment)
+            if aperture in groups:
+                apertures.remove(aperture)
+                apertures.insert(0, aperture)
+            for key in apertures:
+                reordered += groups[key]
+                if key is not None:
+                    aperture = key
+
+        self._changes = (self._countChanges(segments),
+                         self._countChanges(reordered))
+
+        return reordered
+
+
+
+    def _countChanges(self, segments):
         """
-        Linearises a path into Gerber points. The 'offset' Point() is
-        added to the location.
-        Returns a list of Gerber 'commands'.
+        Returns the number of times the polarity and the aperture of
+        strokes change in 'segments'
         """
+        polarity_changes = 0
+        aperture_changes = 0
+        polarity = None
+        aperture = None
+        for segment in segments:
+            if segment[0] != polarity:
+                polarity = segment[0]
+                polarity_changes += 1
+            if segment[1] is not None and segment[1] != aperture:
+                aperture = segment[1]
+                aperture_changes += 1
+        return polarity_changes, aperture_changes
 
-        # store the Gerber commands in this list
-        commands = {}
 
-        polarity_sequence = ''
-        order = ''
 
-        # Create a list of lineat points from the input path
-        coords = self._pathToPoints(path)
 
-        coord_list = []
 
-        # Each 'segment' correspond to a shape within the complete
-        # poth.
-        for segment in coords:
 
-            segment_coord_list = []
+    def _getParamCommand(self, param, comment=None):
+        """
+        Returns a list of Gerber parameter command with an optional
+        comment
+        """
+        commands = []
+        if comment != None:
+            commands.append('G04 ' + comment + ' *\n')
+        commands.append('%' + param + '*%\n')
+ 
+        return commands
 
-            text = self._getGerberisedPoint(segment[0],offset)
-            segment_coord_list.append("G01%sD02*\n" % text)
 
-            for coord in segment[1:]:
-                text = self._getGerberisedPoint(coord,offset)
-                segment_coord_list.append("G01%sD01*\n" % text)
 
-            coord_list.append(segment_coord_list)
 
-        return coord_list
 
+    def _pathToPoints(self, path):
+        """
+        Converts a path into points, as a tuple of 'x' and 'y' values
+        for each segment
+        """
+        path = SvgPath(path.get('d'))
+        coords = path.getCoordValues(self._steps, 
+                                     self._length)
 
+        return coords
 
 
 
@@ -456,19 +886,8 @@ class Gerber():
         Convert a float to the ridiculous Gerber format 
         """
  
-        # Add offset to coordinate
-        coord += offset
-     
-        # Split to integer and decimal content; the reformatting is required 
-        # for floats coming in represented in scientific notation
-        xi, xd = str("%f"%coord.x).split(".")
-        yi, yd = str("%f"%-coord.y).split(".")
-     
-        # Pad decimals to required number of digits for Gerber (yuck!)
-        xd = xd.ljust(self._decimals, '0')
-        yd = yd.ljust(self._decimals, '0')
-     
-        return "X%s%sY%s%s" % (xi, xd[:self._decimals], yi, yd[:self._decimals])
+        return encodeCoords((coord.x, coord.y), offset, self._decimals,
+                            "X%fY%f", "")
 
 
 
@@ -529,6 +948,31 @@ class Gerber():
         for aperture in self._apertures:
             pa.append("%%ADD%dC,%.2fX*%%\n" % (self._apertures[aperture], 
                                                float(aperture)))
+
+        # Apertures of flashed shapes, in the order they're numbered
+        flash_apertures = sorted(self._flash_apertures.items(), key=lambda a: a[1])
+        if any(aperture[0] == 'RoundRect' for aperture, num in flash_apertures):
+            # Rectangle with round corners: width, height and corner
+            # radius. It's made of two overlapping rectangles and a
+            # circle at each corner.
+            pa.append("%AMRoundRect*\n"
+                      "21,1,$1,$2-$3-$3,0,0,0*\n"
+                      "21,1,$1-$3-$3,$2,0,0,0*\n"
+                      "1,1,$3+$3,$1/2-$3,$2/2-$3*\n"
+                      "1,1,$3+$3,-$1/2+$3,$2/2-$3*\n"
+                      "1,1,$3+$3,-$1/2+$3,-$2/2+$3*\n"
+                      "1,1,$3+$3,$1/2-$3,-$2/2+$3*%\n")
+        for (template, width, height, radius), num in flash_apertures:
+            if template == 'C':
+                modifiers = "%.*f" % (self._decimals, width)
+            elif template == 'RoundRect':
+                modifiers = "%.*fX%.*fX%.*f" % (self._decimals, width,
+                                                self._decimals, height,
+                                                self._decimals, radius)
+            else:
+                modifiers = "%.*fX%.*f" % (self._decimals, width,
+                                           self._decimals, height)
+            pa.append("%%ADD%d%s,%s*%%\n" % (num, template, modifiers))
         pa.append("\n")
 
         return pa
@@ -22,7 +22,7 @@ except:
 
 from .shape import Shape
 from .style import Style
-from .component import Component
+from .component import Component, makeComponents
 from .point import Point
 
 
@@ -75,8 +75,13 @@ class Module():
         #   http://www.w3.org/TR/SVG/struct.html#Head
         # This is where masking elements that are used for pours are stored
         defs = et.SubElement(self._module, 'defs')
+        self._defs = defs
         self._masks = {}
 
+        # Shapes placed once in 'defs' and then used by components; see
+        # _getInstanceGroup()
+        self._instances = {}
+
         for pcb_layer in config.stk['layer-names']:
              element = et.SubElement(defs, 'mask',
                                      id="mask-%s" % pcb_layer,
@@ -154,11 +159,28 @@ class Module():
         except IOError as e:
             print("I/O error({0}): {1}".format(e.errno, e.strerror))
      
-        f.write(et.tostring(svg_doc, pretty_print=True))
+        # With the 'stream-svg' option the document is written a layer
+        # and sheet at a time, and emptied as it's written, rather
+        # than serialised whole
+        if config.tmp['stream-svg'] == True:
+            svg.writeSvgIncrementally(self._module, f)
+            self._svg_doc = None
+        else:
+            f.write(et.tostring(svg_doc, pretty_print=True))
+            self._svg_doc = svg_doc
         f.close()
 
 
 
+    def getSvg(self):
+        """
+        Returns the module's SVG document, if it's still whole after
+        it's been written
+        """
+        return self._svg_doc
+
+
+
 
 
     def _placeOutlineDimensions(self):
@@ -282,6 +304,14 @@ class Module():
             else:
                 invert = False
 
+            # Components that have the same shapes when placed
+            instance_key = (component_type,
+                            component.getFootprintName(),
+                            rotation,
+                            component.getScale(),
+                            repr(component.getRotatePoint()),
+                            placement_layer)
+
             for pcb_layer in config.stk['layer-names']:
 
                 there_are_pours = utils.checkForPoursInLayer(pcb_layer)
@@ -307,15 +337,18 @@ class Module():
                         shape_group.set('{'+config.cfg['ns']['pcbmode']+'}refdef', component.getRefdef())
 
                     style = utils.dictToStyleText(config.stl['layout']['conductor']['pads']['labels'])
-                    label_group = et.SubElement(shape_group, 'g', style=style)
+                    instance = self._getInstanceGroup(shape_group, instance_key + ('conductor', pcb_layer, len(shapes)))
+                    if instance is not None:
+                        label_group = et.SubElement(instance, 'g', style=style)
 
                     for shape in shapes:
-                        place.placeShape(shape, shape_group, invert)
+                        if instance is not None:
+                            place.placeShape(shape, instance, invert)
 
                         # Add pin labels
                         # TODO: This isn't perfect, but good enough for now
                         label = shape.getLabel()
-                        if label != None:
+                        if label != None and instance is not None:
                             label_location = shape.getLocation()
                             label_rotation = shape.getRotation()
                             label_transform = "rotate(%s)" % label_rotation
@@ -349,8 +382,10 @@ class Module():
                                                       config.cfg['invert-y']*location[1])
                     group = et.SubElement(shape_group, 'g', transform=transform)
                     group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'pours')
-                    for shape in shapes:
-                        placed_element = place.placeShape(shape, group, invert)
+                    instance = self._getInstanceGroup(group, instance_key + ('pours', pcb_layer, len(shapes)))
+                    if instance is not None:
+                        for shape in shapes:
+                            placed_element = place.placeShape(shape, instance, invert)
 
 
 
@@ -367,8 +402,10 @@ class Module():
                                                       config.cfg['invert-y']*location[1])
                     group = et.SubElement(svg_layer, 'g', transform=transform)
                     group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'component-shapes')
-                    for shape in shapes:
-                        placed_element = place.placeShape(shape, group, invert)
+                    instance = self._getInstanceGroup(group, instance_key + ('soldermask', pcb_layer, len(shapes)))
+                    if instance is not None:
+                        for shape in shapes:
+                            placed_element = place.placeShape(shape, instance, invert)
 
      
                 # Solderpaste
@@ -383,8 +420,10 @@ class Module():
                                                       config.cfg['invert-y']*location[1])
                     group = et.SubElement(svg_layer, 'g', transform=transform)
                     group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'component-shapes')
-                    for shape in shapes:
-                        placed_element = place.placeShape(shape, group, invert)
+                    instance = self._getInstanceGroup(group, instance_key + ('solderpaste', pcb_layer, len(shapes)))
+                    if instance is not None:
+                        for shape in shapes:
+                            placed_element = place.placeShape(shape, instance, invert)
 
 
 
@@ -400,6 +439,13 @@ class Module():
                                                       config.cfg['invert-y']*location[1])
                     shape_group = et.SubElement(svg_layer, 'g', transform=transform)
                     shape_group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'component-shapes')
+
+                    # Refdefs are different for every component so
+                    # they're never used from instances
+                    others = [shape for shape in shapes if getattr(shape, 'is_refdef', False) != True]
+                    instance = None
+                    if len(others) > 0:
+                        instance = self._getInstanceGroup(shape_group, instance_key + ('silkscreen', pcb_layer, len(others)))
      
                     for shape in shapes:
                         # Refdefs need to be in their own groups so that their
@@ -417,8 +463,8 @@ class Module():
                                 refdef_group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'refdef')
                                 refdef_group.set('{'+config.cfg['ns']['pcbmode']+'}refdef', refdef)
                                 placed_element = place.placeShape(shape, refdef_group, invert)
-                        else:
-                            placed_element = place.placeShape(shape, shape_group, invert)
+                        elif instance is not None:
+                            placed_element = place.placeShape(shape, instance, invert)
 
 
 
@@ -433,8 +479,15 @@ class Module():
                     transform = "translate(%s,%s)" % (location[0],
                                                       config.cfg['invert-y']*location[1])
                     group = et.SubElement(svg_layer, 'g', transform=transform)
+                    others = [shape for shape in shapes if getattr(shape, 'is_refdef', False) != True]
+                    instance = None
+                    if len(others) > 0:
+                        instance = self._getInstanceGroup(group, instance_key + ('assembly', pcb_layer, len(others)))
                     for shape in shapes:
-                        placed_element = place.placeShape(shape, group, invert)
+                        if getattr(shape, 'is_refdef', False) == True:
+                            placed_element = place.placeShape(shape, group, invert)
+                        elif instance is not None:
+                            placed_element = place.placeShape(shape, instance, invert)
 
 
 
@@ -448,10 +501,12 @@ class Module():
                                                       config.cfg['invert-y']*location[1])
                     group = et.SubElement(svg_layer, 'g', transform=transform)
                     group.set('{'+config.cfg['ns']['pcbmode']+'}type', 'component-shapes')
-                    for shape in shapes:
-                        placed_element = place.placeShape(shape, group, invert)
-                        placed_element.set('{'+config.cfg['ns']['pcbmode']+'}diameter',
-                                           str(shape.getDiameter()))
+                    instance = self._getInstanceGroup(group, instance_key + ('drills', pcb_layer, len(shapes)))
+                    if instance is not None:
+                        for shape in shapes:
+                            placed_element = place.placeShape(shape, instance, invert)
+                            placed_element.set('{'+config.cfg['ns']['pcbmode']+'}diameter',
+                                               str(shape.getDiameter()))
 
 
             # Place component origin marker
@@ -522,6 +577,36 @@ class Module():
 
 
 
+    def _getInstanceGroup(self, group, key):
+        """
+        With the 'use-instances' option, shapes that are the same for
+        all components with the same 'key' are placed only once, in a
+        group in 'defs', and 'group' gets a 'use' element that refers
+        to it. Returns the group to place the shapes in, or None if
+        they've already been placed. Without the option, the shapes
+        are placed in 'group' itself.
+        """
+        if config.tmp['use-instances'] == False:
+            return group
+
+        instance_id = self._instances.get(key)
+        if instance_id is None:
+            instance_id = "instance-%d" % (len(self._instances) + 1)
+            self._instances[key] = instance_id
+            instance = et.SubElement(self._defs, 'g', id=instance_id)
+        else:
+            instance = None
+
+        use = et.SubElement(group, 'use')
+        use.set('{'+config.cfg['ns']['xlink']+'}href', '#' + instance_id)
+
+        return instance
+
+
+
+
+
+
     def _placeRouting(self):
         """
         """
@@ -803,6 +888,12 @@ class Module():
               'svg':config.cfg['ns']['svg']}
         drills = drill_layer.findall(".//*[@pcbmode:diameter]", namespaces=ns)
 
+        # Add the drills of components placed with 'use' elements
+        for use in drill_layer.iter('use'):
+            href = use.get('{'+config.cfg['ns']['xlink']+'}href')
+            instance = self._defs.find("g[@id='%s']" % href.lstrip('#'))
+            drills += instance.findall(".//*[@pcbmode:diameter]", namespaces=ns)
+
         drills_dict = {}
         longest_text = 0
         largest_drill = 0
@@ -969,6 +1060,9 @@ and is maintained by Boldport
         # Store components here
         components = []
 
+        # Components to make
+        items = []
+
         # Get shapes for each component definition
         for refdef in components_dict:
             component_dict = components_dict[refdef]
@@ -982,6 +1076,14 @@ and is maintained by Boldport
             place = component_dict.get('place', True)
 
             if (show == True) and (place == True):
+                items.append((refdef, component_dict))
+
+        # Components can be made in parallel with the '--jobs' option
+        jobs = config.tmp['jobs']
+        if jobs > 1 and len(items) > 1:
+            components = makeComponents(items, min(jobs, len(items)))
+        else:
+            for refdef, component_dict in items:
                 component = Component(refdef, component_dict)
                 components.append(component)
         
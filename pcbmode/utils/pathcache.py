@@ -0,0 +1,297 @@
+#!/usr/bin/python
+
+import os
+import json
+import time
+import sqlite3
+
+from . import messages as msg
+from .pathdata import PathData
+
+
+
+# Bump this when the format of path records changes; databases with
+# another version are discarded
+SCHEMA_VERSION = 3
+
+
+
+
+def openPathCache(build_dir, settings=None):
+    """
+    Returns the path cache for the board's build directory, using the
+    backend set in the 'path-cache' settings, e.g.,
+
+      "path-cache": {"backend": "sqlite", "max-entries": 100000, "max-age": 90}
+
+    where 'max-age' is in days.
+    """
+
+    settings = settings or {}
+    backend = settings.get('backend') or 'sqlite'
+
+    if backend == 'json':
+        return JsonPathCache(os.path.join(build_dir, 'paths_db.json'))
+    elif backend == 'sqlite':
+        return SqlitePathCache(os.path.join(build_dir, 'paths_db.sqlite'),
+                               max_entries=settings.get('max-entries'),
+                               max_age=settings.get('max-age'))
+    else:
+        msg.error("'%s' isn't a supported path cache backend; use 'sqlite' or 'json'" % backend)
+
+
+
+
+class PathCache():
+    """
+    Caches the records of parsed paths, keyed by the digest of the
+    path. Records are dicts that are handed out to, and filled by,
+    SvgPath; new ones are written to storage by save().
+    """
+
+    def __init__(self):
+        self._records = {}
+        self._new = set()
+
+
+    def get(self, digest, default=None):
+        record = self._records.get(digest)
+        if record is None:
+            record = self._load(digest)
+            if record is None:
+                return default
+            self._records[digest] = record
+        return record
+
+
+    def __getitem__(self, digest):
+        record = self.get(digest)
+        if record is None:
+            raise KeyError(digest)
+        return record
+
+
+    def __setitem__(self, digest, record):
+        self._records[digest] = record
+        self._new.add(digest)
+
+
+    def __contains__(self, digest):
+        return self.get(digest) is not None
+
+
+    def _load(self, digest):
+        return None
+
+
+    def getWorkerCache(self):
+        """
+        Returns a cache for a worker process that looks paths up in the
+        same storage, and can be pickled
+        """
+        cache = PathCache()
+        cache._records = dict(self._records)
+        return cache
+
+
+    def popChanges(self):
+        """
+        Returns the records that were added, and the digests of those
+        that were looked up in storage, since this was last called.
+        A worker process's cache returns these so that they can be
+        merged into the main cache with merge().
+        """
+        new = dict((digest, self._records[digest]) for digest in self._new)
+        self._new = set()
+        return new, []
+
+
+    def merge(self, new, used):
+        for digest in new:
+            self[digest] = new[digest]
+
+
+    def save(self):
+        pass
+
+
+    def close(self):
+        pass
+
+
+    def exportJson(self, filename):
+        """
+        Writes the records that have been used or added in this run
+        as a JSON paths database
+        """
+        with open(filename, 'w') as f:
+            # Parsed paths are stored compactly; 'toJson' converts them
+            json.dump(self._records, f, sort_keys=True, indent=2, default=PathData.toJson)
+
+
+
+
+class JsonPathCache(PathCache):
+    """
+    The whole cache is one JSON file that's read when it's opened and
+    rewritten when there's anything new
+    """
+
+    def __init__(self, filename):
+        PathCache.__init__(self)
+        self._filename = filename
+        if os.path.isfile(filename):
+            try:
+                with open(filename, 'r') as f:
+                    self._records = json.load(f)
+            except ValueError:
+                msg.info("Discarding the unreadable paths database %s" % filename)
+
+
+    def save(self):
+        if len(self._new) > 0:
+            self.exportJson(self._filename)
+            self._new = set()
+
+
+
+
+class SqlitePathCache(PathCache):
+    """
+    Records are stored in an SQLite database and only read when a path
+    is looked up. New records are written back in one transaction,
+    along with when each record was last used, which is what the
+    oldest records are evicted by when there are more than
+    'max_entries' or they haven't been used for 'max_age' days.
+    """
+
+    def __init__(self, filename, max_entries=None, max_age=None, read_only=False):
+        PathCache.__init__(self)
+        self._filename = filename
+        self._max_entries = max_entries
+        self._max_age = max_age
+        self._used = set()
+
+        # Worker processes only read the database, whose schema the
+        # main process has already checked; see getWorkerCache()
+        self._read_only = read_only
+
+        # The database is only opened when a path is looked up, and only
+        # created when there's something to save
+        self._db = None
+        self._missing = False
+
+
+    def _connect(self):
+        try:
+            self._db = sqlite3.connect(self._filename)
+            if self._read_only == True:
+                self._db.execute("PRAGMA query_only = ON")
+            else:
+                self._checkSchema()
+        except sqlite3.OperationalError as e:
+            # The database is there but can't be used right now, e.g.,
+            # it's locked by another process
+            msg.error("Couldn't use the paths database %s (%s)" % (self._filename, e))
+        except sqlite3.DatabaseError:
+            if self._read_only == True:
+                msg.error("Couldn't read the paths database %s" % self._filename)
+            msg.info("Discarding the unreadable paths database %s" % self._filename)
+            if self._db is not None:
+                self._db.close()
+            os.remove(self._filename)
+            self._db = sqlite3.connect(self._filename)
+            self._checkSchema()
+
+
+    def _checkSchema(self):
+        db = self._db
+        version = None
+        try:
+            row = db.execute("SELECT value FROM meta WHERE key = 'schema'").fetchone()
+            if row is not None:
+                version = int(row[0])
+        except sqlite3.OperationalError as e:
+            # A database without the tables is made from scratch;
+            # anything else, like it being locked, isn't handled here
+            if 'no such table' not in str(e):
+                raise
+
+        if version != SCHEMA_VERSION:
+            with db:
+                db.execute("DROP TABLE IF EXISTS paths")
+                db.execute("DROP TABLE IF EXISTS meta")
+                db.execute("CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT)")
+                db.execute("CREATE TABLE paths (digest TEXT PRIMARY KEY, record TEXT, used REAL)")
+                db.execute("CREATE INDEX paths_used ON paths (used)")
+                db.execute("INSERT INTO meta VALUES ('schema', ?)", (str(SCHEMA_VERSION),))
+
+
+    def _load(self, digest):
+        if self._db is None:
+            if self._missing == True or not os.path.isfile(self._filename):
+                self._missing = True
+                return None
+            self._connect()
+        row = self._db.execute("SELECT record FROM paths WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            return None
+        self._used.add(digest)
+        return json.loads(row[0])
+
+
+    def getWorkerCache(self):
+        # The schema is checked, and the database migrated, here
+        # before there are any workers that would each try to
+        if self._db is None and os.path.isfile(self._filename):
+            self._connect()
+        return SqlitePathCache(self._filename, read_only=True)
+
+
+    def popChanges(self):
+        new, used = PathCache.popChanges(self)
+        used = list(self._used)
+        self._used = set()
+        return new, used
+
+
+    def merge(self, new, used):
+        PathCache.merge(self, new, used)
+        self._used.update(used)
+
+
+    def save(self):
+        if len(self._new) == 0 and len(self._used) == 0:
+            return
+
+        if self._db is None:
+            self._connect()
+
+        now = time.time()
+        db = self._db
+
+        with db:
+            db.executemany("INSERT OR REPLACE INTO paths VALUES (?, ?, ?)",
+                           [(digest,
+                             json.dumps(self._records[digest], sort_keys=True, default=PathData.toJson),
+                             now) for digest in self._new])
+            db.executemany("UPDATE paths SET used = ? WHERE digest = ?",
+                           [(now, digest) for digest in self._used])
+
+            if self._max_age is not None:
+                db.execute("DELETE FROM paths WHERE used < ?",
+                           (now - float(self._max_age)*24*60*60,))
+
+            if self._max_entries is not None:
+                db.execute("DELETE FROM paths WHERE digest NOT IN "
+                           "(SELECT digest FROM paths ORDER BY used DESC LIMIT ?)",
+                           (int(self._max_entries),))
+
+        self._new = set()
+        self._used = set()
+
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -0,0 +1,447 @@
+#!/usr/bin/python
+
+import re
+from math import sqrt
+from array import array
+
+from . import messages as msg
+
+
+
+# Number of coordinates that make up one set of parameters for each
+# of the supported SVG path commands
+_path_cmd_params = {'m': 2, 'l': 2, 't': 2,
+                    'q': 4, 's': 4,
+                    'c': 6,
+                    'h': 1, 'v': 1,
+                    'z': 0}
+
+# A path is tokenised into commands, coordinates, or anything else,
+# which is an error
+_path_token = re.compile(r"([A-Za-z])|([-+]?(?:\d+(?:\.\d*)?|\.\d+)(?:[Ee][-+]?\d+)?)|([^\s,])")
+
+
+
+
+def tokenisePath(path):
+    """
+    Splits an SVG path into a list of (command, coordinates) tuples,
+    where 'coordinates' is the list of numbers, as strings, that
+    follow the command
+    """
+
+    tokens = []
+    cmd = None
+    coords = []
+
+    for letter, number, other in _path_token.findall(path):
+        if letter != '':
+            if cmd is not None:
+                tokens.append(_checkPathCoords(cmd, coords))
+            # Command letters are always plain strings, as they were
+            # with pyparsing, since the representation of parsed
+            # paths is used for digests in the paths database
+            cmd = str(letter)
+            coords = []
+        elif number != '' and cmd is not None:
+            coords.append(number)
+        else:
+            msg.error("Unexpected '%s' while parsing SVG path '%s'" % (other or number, path))
+
+    if cmd is None:
+        msg.error("Couldn't find any commands in SVG path '%s'" % path)
+
+    tokens.append(_checkPathCoords(cmd, coords))
+
+    return tokens
+
+
+
+
+def _checkPathCoords(cmd, coords):
+    """
+    Checks that a path command has a valid number of coordinates
+    """
+
+    params = _path_cmd_params.get(cmd.lower())
+
+    if params is None:
+        msg.error("Found an unsupported SVG path command '%s'" % cmd)
+
+    if params == 0:
+        if len(coords) > 0:
+            msg.error("SVG path command '%s' doesn't take coordinates" % cmd)
+    elif len(coords) == 0 or len(coords) % params != 0:
+        msg.error("SVG path command '%s' has the wrong number of coordinates (%s)" % (cmd, len(coords)))
+
+    return cmd, coords
+
+
+
+
+def _cubicRange(p0, p1, p2, p3):
+    """
+    Returns the smallest and largest values of a one dimensional cubic
+    Bezier curve, which are at its ends or where its derivative is
+    zero
+    """
+
+    values = [p0, p3]
+
+    # The derivative, divided by 3, is a*t^2 + b*t + c
+    a = -p0 + 3*p1 - 3*p2 + p3
+    b = 2*(p0 - 2*p1 + p2)
+    c = p1 - p0
+
+    if abs(a) < 1e-12:
+        roots = [-c/b] if abs(b) > 1e-12 else []
+    else:
+        discriminant = b*b - 4*a*c
+        if discriminant < 0:
+            roots = []
+        else:
+            discriminant = sqrt(discriminant)
+            roots = [(-b + discriminant)/(2*a), (-b - discriminant)/(2*a)]
+
+    for t in roots:
+        if 0 < t < 1:
+            s = 1 - t
+            values.append(s*s*s*p0 + 3*s*s*t*p1 + 3*s*t*t*p2 + t*t*t*p3)
+
+    return min(values), max(values)
+
+
+
+
+class _Bounds():
+    """
+    Works out the bounding box of a relative path as its commands are
+    added one at a time with add(). Quadratic curves are measured as
+    the cubic curves that they're drawn as, i.e., with the end point
+    as the second control point.
+    """
+
+    def __init__(self):
+        self.box = None
+        self._x = 0.0
+        self._y = 0.0
+        # The last control point of a quadratic curve, for 't'
+        self._control = (0.0, 0.0)
+
+
+    def _addPoint(self, x, y):
+        box = self.box
+        if box is None:
+            self.box = [x, y, x, y]
+        else:
+            if x < box[0]: box[0] = x
+            if y < box[1]: box[1] = y
+            if x > box[2]: box[2] = x
+            if y > box[3]: box[3] = y
+
+
+    def _addCubic(self, x1, y1, x2, y2, x3, y3):
+        x0, y0 = self._x, self._y
+        min_x, max_x = _cubicRange(x0, x1, x2, x3)
+        min_y, max_y = _cubicRange(y0, y1, y2, y3)
+        self._addPoint(min_x, min_y)
+        self._addPoint(max_x, max_y)
+        self._x, self._y = x3, y3
+
+
+    def add(self, cmd, coords):
+        """
+        Adds a relative command with its coordinates, as a flat list
+        """
+
+        x, y = self._x, self._y
+
+        if cmd in 'ml':
+            for n in range(0, len(coords), 2):
+                x += coords[n]
+                y += coords[n+1]
+                self._addPoint(x, y)
+            self._x, self._y = x, y
+        elif cmd == 'h':
+            for dx in coords:
+                x += dx
+                self._addPoint(x, y)
+            self._x = x
+        elif cmd == 'v':
+            for dy in coords:
+                y += dy
+                self._addPoint(x, y)
+            self._y = y
+        elif cmd == 'c':
+            for n in range(0, len(coords), 6):
+                x, y = self._x, self._y
+                self._addCubic(x + coords[n], y + coords[n+1],
+                               x + coords[n+2], y + coords[n+3],
+                               x + coords[n+4], y + coords[n+5])
+        elif cmd == 'q':
+            for n in range(0, len(coords), 4):
+                x, y = self._x, self._y
+                self._control = (x + coords[n], y + coords[n+1])
+                end_x, end_y = x + coords[n+2], y + coords[n+3]
+                self._addCubic(self._control[0], self._control[1],
+                               end_x, end_y, end_x, end_y)
+        elif cmd == 't':
+            for n in range(0, len(coords), 2):
+                x, y = self._x, self._y
+                self._control = (2*x - self._control[0], 2*y - self._control[1])
+                end_x, end_y = x + coords[n], y + coords[n+1]
+                self._addCubic(self._control[0], self._control[1],
+                               end_x, end_y, end_x, end_y)
+
+
+
+
+class PathData(object):
+    """
+    A parsed SVG path, stored compactly as a string with a letter for
+    each command, an array of how many coordinates each command has,
+    and one array of all the coordinates as floats.
+
+    Iterating over a path gives (command, parameters) tuples, where
+    'parameters' is a list of (x, y) tuples, or (value,) tuples for
+    'h' and 'v' commands.
+
+    Sub-paths are views of the same arrays, so making them doesn't
+    copy any coordinates.
+    """
+
+    __slots__ = ('_commands', '_counts', '_coords', '_start', '_end', '_offset', '_bbox')
+
+    def __init__(self, commands='', counts=None, coords=None, start=0, end=None, offset=0):
+
+        # The bounding box, once it's been worked out; see
+        # getBoundingBox()
+        self._bbox = None
+
+        self._commands = commands
+        self._counts = counts
+        if self._counts is None:
+            self._counts = array('I')
+        self._coords = coords
+        if self._coords is None:
+            self._coords = array('d')
+
+        # The range of commands and the offset of the first one's
+        # coordinates, which make this a view into the arrays
+        self._start = start
+        self._end = end
+        if self._end is None:
+            self._end = len(commands)
+        self._offset = offset
+
+
+
+    @classmethod
+    def fromString(cls, path):
+        """
+        Parses an SVG path string
+        """
+
+        commands = []
+        counts = array('I')
+        coords = array('d')
+
+        for cmd, numbers in tokenisePath(path):
+            commands.append(cmd)
+            counts.append(len(numbers))
+            coords.extend([float(n) for n in numbers])
+
+        return cls(''.join(commands), counts, coords)
+
+
+
+    @classmethod
+    def fromJson(cls, data):
+        """
+        Creates a path from what toJson() returned. Paths databases
+        made by older versions store paths parsed into lists, and these
+        are converted as well.
+        """
+
+        if isinstance(data, dict):
+            return cls(str(data['commands']),
+                       array('I', data['counts']),
+                       array('d', data['coords']))
+
+        commands = []
+        counts = array('I')
+        coords = array('d')
+
+        for cmd in data:
+            commands.append(str(cmd[0]))
+            n = 0
+            for coord in cmd[1:]:
+                coords.extend([float(c) for c in coord])
+                n += len(coord)
+            counts.append(n)
+
+        return cls(''.join(commands), counts, coords)
+
+
+
+    def toJson(self):
+        """
+        Returns the path in a form that can be stored as JSON
+        """
+        return {'commands': self.getCommands(),
+                'counts': self._counts[self._start:self._end].tolist(),
+                'coords': self.getCoords().tolist()}
+
+
+
+    def toString(self):
+        """
+        Returns the path as an SVG path string
+        """
+
+        p = []
+        for cmd, params in self:
+            p.append(cmd)
+            for param in params:
+                p.append(','.join([repr(c) for c in param]))
+
+        return ' '.join(p)
+
+
+
+    def toList(self):
+        """
+        Returns the path as lists of commands, each followed by its
+        coordinates as lists of strings, as svg.parsePath() does
+        """
+        return [[cmd] + [[repr(c) for c in param] for param in params] for cmd, params in self]
+
+
+
+    def transform(self, matrix):
+        """
+        Returns a new path transformed by a 2x3 affine 'matrix' (see
+        affine.py). The path must be relative, so only its first point
+        is translated; the rest are transformed as vectors. Since they
+        might not be horizontal or vertical anymore, 'h' and 'v'
+        commands become 'l' commands. The bounding box of the new path
+        is worked out as it's made.
+        """
+
+        a, b, c, d, e, f = matrix
+
+        commands = []
+        counts = array('I')
+        coords = array('d')
+        bounds = _Bounds()
+
+        first = True
+        for cmd, params in self:
+            before = len(coords)
+            if cmd == 'h':
+                cmd = 'l'
+                for (x,) in params:
+                    coords.extend((a*x + c*0.0, b*x + d*0.0))
+            elif cmd == 'v':
+                cmd = 'l'
+                for (y,) in params:
+                    coords.extend((a*0.0 + c*y, b*0.0 + d*y))
+            else:
+                for x, y in params:
+                    if first == True:
+                        coords.extend((a*x + c*y + e, b*x + d*y + f))
+                        first = False
+                    else:
+                        coords.extend((a*x + c*y, b*x + d*y))
+            commands.append(cmd)
+            counts.append(len(coords) - before)
+            bounds.add(cmd, coords[before:])
+
+        path = PathData(''.join(commands), counts, coords)
+        path._bbox = bounds.box or [0.0, 0.0, 0.0, 0.0]
+
+        return path
+
+
+
+    def getBoundingBox(self):
+        """
+        Returns the bounding box of the path, which must be relative, as
+        [min_x, min_y, max_x, max_y]. Curves are measured exactly, at
+        their extremes.
+        """
+
+        if self._bbox is None:
+            bounds = _Bounds()
+            coords = self._coords
+            offset = self._offset
+            for i in range(self._start, self._end):
+                count = self._counts[i]
+                bounds.add(self._commands[i], coords[offset:offset + count])
+                offset += count
+            self._bbox = bounds.box or [0.0, 0.0, 0.0, 0.0]
+
+        return self._bbox
+
+
+
+    def __iter__(self):
+
+        coords = self._coords
+        offset = self._offset
+
+        for i in range(self._start, self._end):
+            cmd = self._commands[i]
+            count = self._counts[i]
+            if cmd in 'hHvV':
+                params = [(coords[n],) for n in range(offset, offset + count)]
+            else:
+                params = [(coords[n], coords[n+1]) for n in range(offset, offset + count, 2)]
+            offset += count
+            yield cmd, params
+
+
+
+    def __len__(self):
+        return self._end - self._start
+
+
+
+    def getCommands(self):
+        return self._commands[self._start:self._end]
+
+
+
+    def getCoords(self):
+        return self._coords[self._offset:self._offset + sum(self._counts[self._start:self._end])]
+
+
+
+    def getFirstPoint(self):
+        return [self._coords[self._offset], self._coords[self._offset + 1]]
+
+
+
+    def getSubpaths(self):
+        """
+        Returns a view for every sub-path, i.e., starting at each
+        move command
+        """
+
+        subpaths = []
+        start = self._start
+        offset = self._offset
+        first_offset = offset
+
+        for i in range(self._start + 1, self._end):
+            offset += self._counts[i-1]
+            if self._commands[i] in 'mM':
+                subpaths.append(PathData(self._commands, self._counts, self._coords,
+                                         start, i, first_offset))
+                start = i
+                first_offset = offset
+
+        subpaths.append(PathData(self._commands, self._counts, self._coords,
+                                 start, self._end, first_offset))
+
+        return subpaths
@@ -62,6 +62,17 @@ def placeShape(shape, svg_layer, invert=False, original=False):
     if shape.getType() == 'text':
         element.set('{'+config.cfg['ns']['pcbmode']+'}text', shape.getText())
 
+    # Keep the dimensions of filled rectangles and circles so that
+    # they can be flashed in Gerbers
+    flash = None
+    if original == False and style_type == 'fill':
+        flash = shape.getFlash()
+    if flash != None:
+        width, height, radius = flash
+        element.set('{'+config.cfg['ns']['pcbmode']+'}flash-width', str(width))
+        element.set('{'+config.cfg['ns']['pcbmode']+'}flash-height', str(height))
+        element.set('{'+config.cfg['ns']['pcbmode']+'}flash-radius', str(radius))
+
     return element
 
 
@@ -0,0 +1,79 @@
+#!/usr/bin/python
+
+import os
+import time
+import multiprocessing
+from lxml import etree as et
+
+import pcbmode.config as config
+from . import messages as msg
+
+# pcbmode modules
+from . import utils
+from . import gerber
+from . import excellon
+from .boardsvg import getBoardSvg, BoardSvg
+
+
+
+def makeProductionFiles(manufacturer='default', svg_tree=None, jobs=2):
+    """
+    Makes the Gerbers and the drill file, each with its own job, with a
+    pool of 'jobs' processes. Each job is given the part of the board's
+    SVG that its file is made of, and writes the file.
+    """
+
+    board_svg = getBoardSvg(svg_tree)
+
+    file_jobs = gerber.getGerberJobs(manufacturer, board_svg)
+    file_jobs.append(excellon.getExcellonJob(manufacturer))
+
+    tasks = []
+    for job in file_jobs:
+        if job['type'] == 'gerber':
+            elements = gerber.getGerberJobElements(job, board_svg)
+        else:
+            elements = excellon.getExcellonJobElements(job, board_svg)
+        tasks.append((job, board_svg.getSubdocument(elements)))
+
+    pool = multiprocessing.Pool(min(jobs, len(tasks)),
+                                utils.initWorker,
+                                utils.getWorkerConfig())
+    try:
+        # Jobs take long enough that they're handed out one at a time
+        results = pool.map(_makeFile, tasks, 1)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Workers' output would be mixed up, so it's all printed here
+    for filename, elapsed, changes, new, used in results:
+        config.pth.merge(new, used)
+        msg.subInfo("%s (%.2fs)" % (os.path.basename(filename), elapsed))
+        gerber.reportChanges(filename, changes)
+
+
+
+
+def _makeFile(task):
+    """
+    Makes the file of a job in a worker process of
+    makeProductionFiles()
+    """
+
+    job, subdocument = task
+
+    start = time.time()
+
+    parser = et.XMLParser(huge_tree=True)
+    board_svg = BoardSvg(et.ElementTree(et.fromstring(subdocument, parser)))
+
+    if job['type'] == 'gerber':
+        changes = gerber.writeGerber(job, board_svg)
+    else:
+        excellon.writeExcellon(job, board_svg)
+        changes = None
+
+    new, used = config.pth.popChanges()
+
+    return job['filename'], time.time() - start, changes, new, used
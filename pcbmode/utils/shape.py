@@ -4,16 +4,16 @@ import os
 import copy
 from lxml import etree as et
 
-from pkg_resources import resource_exists, resource_filename
-
 import pcbmode.config as config
 from . import messages as msg
 
 # import pcbmode modules
 from . import utils
 from . import svg
+from . import affine
 from .point import Point
 from .svgpath import SvgPath
+from .font import getFont
 
 
 
@@ -51,18 +51,33 @@ class Shape():
         self._rotate *= self._inv_rotate
         self._rotate_point = shape.get('rotate-point') or Point(0,0)
         self._scale = shape.get('scale') or 1
+        # Scale of the path itself, before it's rotated; see derive()
+        self._path_scale = None
         self._pour_buffer = shape.get('buffer-to-pour')
 
         # A general purpose label field; intended for use for pad
         # labels
         self._label = None
 
+        # The width, height and corner radius of rectangles and
+        # circles, before they're transformed, so that they can be
+        # flashed in Gerbers; see getFlash()
+        self._flash = None
+
         if self._type in ['rect', 'rectangle']:
             path = svg.width_and_height_to_path(self._shape_dict['width'],
                                                 self._shape_dict['height'],
                                                 self._shape_dict.get('radii'))
+            radii = [float(r) for r in (self._shape_dict.get('radii') or {}).values()]
+            # Only corners that all have the same radius can be flashed
+            if len(set(radii)) <= 1 and (len(radii) == 4 or sum(radii) == 0):
+                self._flash = (float(self._shape_dict['width']),
+                               float(self._shape_dict['height']),
+                               sum(radii)/4)
         elif self._type in ['circ', 'circle', 'round']:
             path = svg.circle_diameter_to_path(self._shape_dict['diameter'])
+            diameter = float(self._shape_dict['diameter'])
+            self._flash = (diameter, diameter, diameter/2)
         elif self._type in ['drill']:
             self._diameter = self._shape_dict['diameter']
             path = svg.drillPath(self._diameter)
@@ -72,30 +87,9 @@ class Shape():
             except KeyError:
                 msg.error("Could not find the text to display. The text to be displayed should be defined in the 'value' field, for example, 'value': 'DEADBEEF\\nhar\\nhar'")
 
-            # Get the font's name
-            font = self._shape_dict.get('font-family') or config.stl['layout']['defaults']['font-family']
-            font_filename = "%s.svg" % font
-
-            # Search for the font SVG in these paths
-            paths = [os.path.join(config.cfg['base-dir'],
-                                  config.cfg['locations']['fonts'],
-                                  font_filename)]
-
-            font_resource = ('pcbmode', '/'.join(['fonts',font_filename]))
-            if resource_exists(*font_resource):
-                paths.append(resource_filename(*font_resource))
-
-            filenames = ''
-            font_data = None
-            for path in paths:
-                filename = path
-                filenames += "  %s \n" % filename
-                if os.path.isfile(filename):
-                    font_data = et.ElementTree(file=filename)
-                    break
-
-            if font_data == None:
-                msg.error("Couldn't find style file %s. Looked for it here:\n%s" % (font_filename, filenames))
+            # Get the font's name; fonts are only parsed once
+            font_family = self._shape_dict.get('font-family') or config.stl['layout']['defaults']['font-family']
+            font = getFont(font_family)
 
             try:
                 fs = self._shape_dict['font-size']
@@ -111,13 +105,12 @@ class Shape():
 
             # With the units-per-em we can figure out the scale factor
             # to use for the desired font size
-            units_per_em = float(font_data.find("//n:font-face", namespaces={'n': config.cfg['namespace']['svg']}).get('units-per-em')) or 1000
-            self._scale = font_size/units_per_em
+            self._scale = font_size/font.getUnitsPerEm()
 
             # Get the path to use. This returns the path without
             # scaling, which will be applied later, in the same manner
             # as to the other shape types
-            path, gerber_lp = utils.textToPath(font_data,
+            path, gerber_lp = utils.textToPath(font,
                                                self._text,
                                                letter_spacing,
                                                line_height,
@@ -138,10 +131,11 @@ class Shape():
 
         self._path = SvgPath(path, gerber_lp)
 
-        self._path.transform(scale=self._scale, 
-                             rotate_angle=self._rotate, 
-                             rotate_point=self._rotate_point, 
-                             mirror=self._place_mirrored)
+        # The path is only transformed when its final geometry is
+        # needed, since components add their own rotation and scale
+        self.transformPath(scale=self._scale,
+                           rotate=self._rotate*self._inv_rotate,
+                           mirror=self._place_mirrored)
 
         self._gerber_lp = (shape.get('gerber-lp') or 
                            shape.get('gerber_lp') or 
@@ -154,16 +148,65 @@ class Shape():
 
 
     def transformPath(self, scale=1, rotate=0, rotate_point=Point(), mirror=False, add=False):
-        if add == False:
-            self._path.transform(scale,
-                                 rotate*self._inv_rotate,
-                                 rotate_point,
-                                 mirror)
+        """
+        Sets the transform of the path. With 'add' the shape's own
+        scale and rotation are composed with the given ones. The
+        transform is applied the first time the transformed path or
+        its dimensions are needed.
+        """
+        if add == True:
+            scale *= self._scale
+            rotate = rotate*self._inv_rotate + self._rotate
         else:
-            self._path.transform(scale*self._scale,
-                                 rotate*self._inv_rotate+self._rotate,
-                                 rotate_point+self._rotate_point,
-                                 mirror)
+            rotate *= self._inv_rotate
+
+        self._matrix = affine.compose(affine.scale(scale),
+                                      affine.rotate(rotate))
+        if self._path_scale is not None:
+            self._matrix = affine.multiply(self._matrix, affine.scale(*self._path_scale))
+        self._mirror = mirror
+        self._transformed = False
+
+
+
+    def copy(self):
+        """
+        Returns a copy of the shape that can be moved and transformed
+        without changing this one. The path's parsed geometry, the
+        style and the shape's definition are shared.
+        """
+        shape = copy.copy(self)
+        shape._path = copy.copy(self._path)
+        shape._location = Point(self._location.x, self._location.y)
+        return shape
+
+
+
+    def derive(self, shape_dict, scale_x=1, scale_y=1):
+        """
+        Returns a shape for 'shape_dict', which must be a copy of this
+        shape's definition with only a different 'scale' or, for
+        rectangles and circles, different dimensions, such as for a
+        pad's soldermask. Instead of making and parsing a new path, this
+        shape's path is reused, scaled by 'scale_x' and 'scale_y'
+        around its centre to get the new dimensions.
+        """
+        shape = self.copy()
+        shape._shape_dict = shape_dict
+        shape._scale = shape_dict.get('scale') or 1
+        if scale_x != 1 or scale_y != 1:
+            shape._path_scale = (scale_x, scale_y)
+        shape.transformPath(scale=shape._scale,
+                            rotate=shape._rotate*shape._inv_rotate,
+                            mirror=shape._place_mirrored)
+        return shape
+
+
+
+    def _applyTransform(self):
+        if self._transformed == False:
+            self._path.transformByMatrix(self._matrix, self._mirror)
+            self._transformed = True
 
 
 
@@ -192,6 +235,7 @@ class Shape():
 
 
     def getTransformedPath(self, mirrored=False):
+        self._applyTransform()
         if mirrored == True:
             return self._path.getTransformedMirrored()
         else:
@@ -200,11 +244,13 @@ class Shape():
 
 
     def getWidth(self):
+        self._applyTransform()
         return self._path.getWidth()
 
 
 
     def getHeight(self):
+        self._applyTransform()
         return self._path.getHeight()
 
 
@@ -214,6 +260,44 @@ class Shape():
 
 
 
+    def getFlash(self):
+        """
+        Returns the width, height and corner radius of the placed shape
+        if it's a rectangle or a circle that a Gerber aperture can
+        flash, i.e., it isn't distorted and rectangles are only rotated
+        by multiples of 90 degrees. Otherwise returns None.
+        """
+        if self._flash is None:
+            return None
+
+        sig_dig = config.cfg['significant-digits']
+        width, height, radius = self._flash
+        a, b, c, d, e, f = self._matrix
+
+        if round(b, sig_dig) == 0 and round(c, sig_dig) == 0:
+            scale_x, scale_y = abs(a), abs(d)
+        elif round(a, sig_dig) == 0 and round(d, sig_dig) == 0:
+            # Rotated by 90 or 270 degrees
+            width, height = height, width
+            scale_x, scale_y = abs(c), abs(b)
+        elif (width == height and radius*2 == width and
+              round(a*a + b*b - c*c - d*d, sig_dig) == 0 and
+              round(a*c + b*d, sig_dig) == 0):
+            # A circle can be rotated by any angle
+            scale_x = scale_y = (a*a + b*b) ** 0.5
+        else:
+            return None
+
+        # Rounded corners have to stay round
+        if radius != 0 and round(scale_x - scale_y, sig_dig) != 0:
+            return None
+
+        return (round(width*scale_x, sig_dig),
+                round(height*scale_y, sig_dig),
+                round(radius*scale_x, sig_dig))
+
+
+
     def setStyle(self, style):
         """
         style: Style object
@@ -10,6 +10,7 @@ import pcbmode.config as config
 # import pcbmode modules
 from . import utils
 from .point import Point
+from .pathdata import tokenisePath
 
 
 
@@ -64,6 +65,31 @@ def svg_grammar():
 
 
 
+def parsePath(path):
+    """
+    Parses an SVG path into a list of commands, each a list that starts
+    with the command letter followed by its coordinates as lists of
+    strings, e.g.,
+
+      [['m', ['1', '2']], ['h', ['3']], ['c', ['0', '1'], ['1', '1'], ['1', '0']], ['z']]
+
+    This is the same structure the pyparsing grammar produced, but
+    it's much faster to get to.
+    """
+
+    parsed = []
+
+    for cmd, coords in tokenisePath(path):
+        if cmd in 'hHvV':
+            parsed.append([cmd] + [[coord] for coord in coords])
+        else:
+            parsed.append([cmd] + [[coords[n], coords[n+1]] for n in range(0, len(coords), 2)])
+
+    return parsed
+
+
+
+
 
 
 def absolute_to_relative_path(path):
@@ -79,11 +105,8 @@ def absolute_to_relative_path(path):
     if (path == None) or (path == ''):
         return
 
-    # get SVG path grammar
-    look_for = svg_grammar()
-
-    # parse the input based on this grammar
-    pd = look_for.parseString(path)
+    # parse the path into a list of commands
+    pd = parsePath(path)
 
     p = ''
 
@@ -279,11 +302,8 @@ def relative_svg_path_to_absolute_coord_list(path, bezier_steps=100, segment_len
     return a list of absolute coordinates from an SVG *relative* path
     """
 
-    # get SVG path grammar
-    look_for = svg_grammar()
-
-    # parse the input based on this grammar
-    pd = look_for.parseString(path)
+    # parse the path into a list of commands
+    pd = parsePath(path)
 
     # absolute position
     ap = Point()
@@ -529,11 +549,8 @@ def mirror_path_over_axis(path, axis, width):
     # convert path to relative coordinates; this simplifies the mirroring
     relative_path = absolute_to_relative_path(path)
  
-    # get SVG path grammar
-    look_for = svg_grammar()    
- 
-    # parse the input based on this grammar
-    pd = look_for.parseString(relative_path)
+    # parse the path into a list of commands
+    pd = parsePath(relative_path)
 
     p = ''
  
@@ -596,11 +613,8 @@ def calculate_bounding_box_of_path(path):
     # convert path to relative
     relative_path = absolute_to_relative_path(path)
 
-    # get SVG path grammar
-    look_for = svg_grammar()
-
-    # parse the input based on this grammar
-    pd = look_for.parseString(relative_path)
+    # parse the path into a list of commands
+    pd = parsePath(relative_path)
 
     last_point = Point()
     abs_point = Point()
@@ -878,11 +892,8 @@ def transform_path(p, center=False, scale=1, rotate_angle=0, rotate_point=Point(
 
     width, height = get_width_and_height_of_shape_from_two_points(p_tl, p_br)
 
-    # get SVG path grammar
-    look_for = svg_grammar()
-
-    # parse the input based on this grammar
-    pd = look_for.parseString(p) 
+    # parse the path into a list of commands
+    pd = parsePath(p)
 
     # first point of path
     first_point = Point(pd[0][1][0], pd[0][1][1])
@@ -1505,3 +1516,66 @@ def coord_list_to_svg_path(coord_list):
 
     return path
 
+
+
+
+
+def writeSvgIncrementally(root, f, depth=2):
+    """
+    Writes the SVG document of 'root' to the file 'f' one element at
+    a time, down to 'depth' levels of layers and sheets, and removes
+    each element from the document once it's written. The output is
+    the same as that of et.tostring(root, pretty_print=True), but
+    without having the whole of it in memory. The document is empty
+    afterwards.
+    """
+    _writeElements(root, root, f, b'', b'', depth+1)
+
+
+
+
+def _writeElements(root, parent, f, prefix, suffix, depth):
+    """
+    Writes 'parent' and its children for writeSvgIncrementally().
+    'parent' is the only child of the element it's in, and 'prefix'
+    and 'suffix' are what the serialisation of 'root' has before and
+    after it.
+    """
+
+    children = list(parent)
+
+    # Elements with text aren't indented, so they are written whole
+    if (depth == 0 or len(children) == 0 or parent.text is not None or
+        any(child.tail is not None for child in children)):
+        s = et.tostring(root, pretty_print=True)
+        f.write(s[len(prefix):len(s)-len(suffix)])
+        return
+
+    for child in children:
+        parent.remove(child)
+
+    # An empty comment marks where the children go
+    marker = et.Comment('')
+    parent.append(marker)
+    child_prefix, child_suffix = et.tostring(root, pretty_print=True).split(b'<!---->')
+    parent.remove(marker)
+
+    # Whitespace between children
+    separator = b'\n' + child_prefix[child_prefix.rfind(b'\n')+1:]
+
+    f.write(child_prefix[len(prefix):])
+
+    children.reverse()
+    first = True
+    while len(children) > 0:
+        child = children.pop()
+        if first == False:
+            f.write(separator)
+        first = False
+        parent.append(child)
+        _writeElements(root, child, f, child_prefix, child_suffix, depth-1)
+        # The element is freed once it's written
+        parent.remove(child)
+        child = None
+
+    f.write(child_suffix[:len(child_suffix)-len(suffix)])
@@ -6,6 +6,8 @@ import re
 import subprocess as subp # for shell commands
 import math
 from operator import itemgetter # for sorting lists by dict value
+import copy
+from collections import OrderedDict
 from lxml import etree as et
 
 try:
@@ -42,26 +44,123 @@ def dictToStyleText(style_dict):
 
 
 
-def openBoardSVG():
+def getWorkerConfig():
     """
-    Opens the built PCBmodE board SVG.
+    Returns the configuration that initWorker() sets up a worker process
+    of a multiprocessing.Pool with. Workers look paths up in the same
+    paths database, and the records they add are returned by
+    config.pth.popChanges() to be merged into this process's.
+    """
+    return (config.cfg, config.brd, config.stl, config.stk,
+            config.rte, config.tmp, config.pth.getWorkerCache())
+
+
+
+
+def initWorker(cfg, brd, stl, stk, rte, tmp, pth):
+    """
+    Sets up the configuration of a worker process; see getWorkerConfig()
+    """
+    config.cfg = cfg
+    config.brd = brd
+    config.stl = stl
+    config.stk = stk
+    config.rte = rte
+    config.tmp = tmp
+    config.pth = pth
+
+    # A forked worker starts with the parent's counts, which the
+    # parent already has
+    for key in text_memo_stats:
+        text_memo_stats[key] = 0
+
+
+
+
+def openBoardSVG(svg_tree=None):
+    """
+    Opens the built PCBmodE board SVG. If 'svg_tree', the board's SVG
+    as it was made in this run, is given, it's used instead of reading
+    the file it was written to.
     Returns an ElementTree object
     """
 
+    if svg_tree is not None:
+        # The elements of the board are made without a namespace and
+        # are only in the SVG namespace, the default one, once the
+        # board is read from the file
+        svg_ns = config.cfg['ns']['svg']
+        for element in svg_tree.iter(et.Element):
+            if element.tag[0] != '{':
+                element.tag = '{%s}%s' % (svg_ns, element.tag)
+        expandUseElements(svg_tree)
+        return svg_tree
+
     filename = os.path.join(config.cfg['base-dir'],
                             config.cfg['locations']['build'],
                             config.cfg['name'] + '.svg')
+    # Boards can be large, and the whitespace between elements
+    # isn't needed
+    parser = et.XMLParser(huge_tree=True, remove_blank_text=True)
     try:
-        data = et.ElementTree(file=filename) 
+        data = et.parse(filename, parser)
     except IOError as e:
         msg.error("Cannot open %s; has the board been made using the '-m' option yet?" % filename)
 
+    expandUseElements(data)
+
     return data
 
 
 
 
 
+def expandUseElements(svg_tree):
+    """
+    Replaces every 'use' element with copies of the children of the
+    element it refers to, as if the board was made without the
+    'use-instances' option, so that the board can be read the same way
+    either way
+    """
+
+    svg_ns = config.cfg['ns']['svg']
+    xlink_ns = config.cfg['ns']['xlink']
+
+    uses = list(svg_tree.iter('{%s}use' % svg_ns))
+    if len(uses) == 0:
+        return
+
+    elements = {}
+    for element in svg_tree.iter():
+        element_id = element.get('id')
+        if element_id is not None:
+            elements[element_id] = element
+
+    for use in uses:
+        href = use.get('{%s}href' % xlink_ns) or use.get('href') or ''
+        ref = elements.get(href.lstrip('#'))
+        if ref is None:
+            msg.error("Couldn't find the element '%s' that a 'use' element refers to" % href)
+
+        copies = [copy.deepcopy(child) for child in ref]
+
+        # Keep the transform of the 'use' element itself, if it has one
+        transform = use.get('transform')
+        if transform is not None:
+            group = et.Element('{%s}g' % svg_ns, transform=transform)
+            group.extend(copies)
+            copies = [group]
+
+        parent = use.getparent()
+        index = parent.index(use)
+        parent.remove(use)
+        for i, element in enumerate(copies):
+            parent.insert(index + i, element)
+
+
+
+
+
 
 def parseDimension(string):
     """
@@ -525,25 +624,68 @@ def getTextParams(font_size, letter_spacing, line_height):
 
 
 
-def textToPath(font_data, text, letter_spacing, line_height, scale_factor):
+# Text that has been converted to paths, most recently used last, and
+# how often it was found here or in the paths database ('hits') or had
+# to be laid out ('misses')
+_text_memo = OrderedDict()
+_text_memo_size = 1000
+text_memo_stats = {'hits': 0, 'misses': 0}
+
+
+
+
+def textToPath(font, text, letter_spacing, line_height, scale_factor):
+    """
+    Returns the path and gerber-lp of a text string; see _layoutText().
+    Results are kept in memory for the most recently used texts and
+    in the paths database, keyed by the font and its file's digest,
+    the text, and the text's metrics.
+    """
+
+    key = u"%s:%s:%s:%s:%s:%s" % (font.getFamily(),
+                                  font.getFileDigest(),
+                                  text,
+                                  repr(letter_spacing),
+                                  repr(line_height),
+                                  repr(scale_factor))
+    key = 'text-' + hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    record = _text_memo.get(key)
+    if record is None:
+        record = config.pth.get(key)
+
+    if record is not None:
+        text_memo_stats['hits'] += 1
+    else:
+        text_memo_stats['misses'] += 1
+        text_path, gerber_lp = _layoutText(font, text, letter_spacing, line_height, scale_factor)
+        record = {'path': text_path, 'gerber-lp': gerber_lp}
+        config.pth[key] = record
+
+    # Move the text to the end, or add it, and drop the least
+    # recently used text if there are too many
+    _text_memo.pop(key, None)
+    _text_memo[key] = record
+    if len(_text_memo) > _text_memo_size:
+        _text_memo.popitem(last=False)
+
+    return record['path'], record['gerber-lp']
+
+
+
+
+def _layoutText(font, text, letter_spacing, line_height, scale_factor):
     from .svgpath import SvgPath
     """
     Convert a text string (unicode and newlines allowed) to a path.
+    'font' is a Font object (see font.py).
     The 'scale_factor' is needed in order to scale rp 'letter_spacing' and 'line_height'
     to the original scale of the font.
     """
 
-    # This the horizontal advance that applied to all glyphs unless there's a specification for
-    # for the glyph itself
-    font_horiz_adv_x = float(font_data.find("//n:font", namespaces={'n': config.cfg['namespace']['svg']}).get('horiz-adv-x'))
-    
-    # This is the number if 'units' per 'em'. The default, in the absence of a definition is 1000
-    # according to the SVG spec
-    units_per_em = float(font_data.find("//n:font-face", namespaces={'n': config.cfg['namespace']['svg']}).get('units-per-em')) or 1000
+    # This is the number if 'units' per 'em'
+    units_per_em = font.getUnitsPerEm()
 
-    glyph_ascent = float(font_data.find("//n:font-face", namespaces={'n': config.cfg['namespace']['svg']}).get('ascent'))
-    glyph_decent = float(font_data.find("//n:font-face", namespaces={'n': config.cfg['namespace']['svg']}).get('descent'))
- 
     text_width = 0
     text_path = ''
 
@@ -565,28 +707,20 @@ def textToPath(font_data, text, letter_spacing, line_height, scale_factor):
     for i, symbol in enumerate(text[:]):
 
         symbol = htmlpar.unescape(symbol)
-        # get the glyph definition from the file
+        # get the glyph definition from the font
         if symbol == '\n':
             text_width = 0
             text_height += units_per_em + (line_height/scale_factor-units_per_em)
         else:
-            glyph = font_data.find(u'//n:glyph[@unicode="%s"]' % symbol, namespaces={'n': config.cfg['namespace']['svg']})
-            if glyph == None:
-                utils.throw("Damn, there's no glyph definition for '%s' in the '%s' font :(" % (symbol, font))
-            else:
-                # Unless the glyph has its own width, use the global font width
-                glyph_width = float(glyph.get('horiz-adv-x') or font_horiz_adv_x)
-                if symbol != ' ':
-                    glyph_path = SvgPath(glyph.get('d'))
-                    first_point = glyph_path.getFirstPoint()
-                    offset_x = float(first_point[0])
-                    offset_y = float(first_point[1])
-                    path = glyph_path.getRelative()
-                    path = re.sub('^(m\s?[-\d\.]+\s?,\s?[-\d\.]+)', 'M %s,%s' % (str(text_width+offset_x), str(offset_y-text_height)), path)
-                    gerber_lp += (glyph.get('gerber-lp') or 
-                                  glyph.get('gerber_lp') or 
-                                  "%s" % 'd'*glyph_path.getNumberOfSegments())
-                    text_path += "%s " % (path)
+            glyph = font.getGlyph(symbol)
+            # The glyph's width is its own or the font's
+            glyph_width = glyph['horiz-adv-x']
+            if symbol != ' ' and glyph.get('relative') is not None:
+                offset_x, offset_y = glyph['first-point']
+                path = glyph['relative']
+                path = re.sub('^(m\s?[-\d\.]+\s?,\s?[-\d\.]+)', 'M %s,%s' % (str(text_width+offset_x), str(offset_y-text_height)), path)
+                gerber_lp += glyph['gerber-lp']
+                text_path += "%s " % (path)
 
             text_width += glyph_width+letter_spacing/scale_factor
 